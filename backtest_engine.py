@@ -0,0 +1,342 @@
+import copy
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from indicators import ExpandingMean, RollingStd
+from investment_calendar import get_scheduled_dates
+
+
+def to_day_array(index):
+    """把日期索引（date 对象或 DatetimeIndex）转换为 datetime64[D] 数组"""
+    return pd.DatetimeIndex(index).values.astype('datetime64[D]')
+
+
+def get_investment_positions(start_date, end_date, index):
+    """
+    返回每月第二个周三在 index 中对应的位置
+
+    如果当天不是交易日则顺延到下一个交易日，超出数据范围时使用最后一个交易日
+    """
+    days = to_day_array(index)
+    if len(days) == 0:
+        return np.array([], dtype=int)
+
+    scheduled = np.array(get_scheduled_dates(start_date, end_date), dtype='datetime64[D]')
+    positions = np.searchsorted(days, scheduled, side='left')
+    return np.minimum(positions, len(days) - 1)
+
+
+def compute_weights(std, avg_std, min_weight=0.8, max_weight=2):
+    """
+    向量化计算加权定投的权重
+
+    与 analyze_and_plot 中调用 InvestmentApp.calculate_weight(price, sma, std, avg_std) 的结果一致：
+    以当前波动率相对历史平均波动率的偏离决定权重，再限制在 [min_weight, max_weight] 内
+    """
+    std = np.asarray(std, dtype=float)
+    avg_std = np.asarray(avg_std, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        difference = np.where(avg_std > 0, (std - avg_std) / avg_std, 0.0)
+    weight = np.where(difference < -0.1, 1.5, np.where(difference > 0.1, 0.5, 1.0))
+    return np.clip(weight, min_weight, max_weight)
+
+
+class BacktestState:
+    """
+    可保存和恢复的回测状态
+
+    daily_data 只包含计划日期不晚于最后一个交易日的投资；计划日期超出数据范围、
+    暂时记在最后一个交易日上的投资不写入状态，恢复时按新的数据重新确定。
+    rolling_std 和 avg_std 是滚动标准差及其历史均值的流式指标，恢复时逐个价格 O(1) 更新。
+    """
+
+    version = 2
+
+    def __init__(self, params, start_date, end_date, daily_data, rolling_std, avg_std):
+        self.version = BacktestState.version
+        self.params = params
+        self.start_date = start_date
+        self.end_date = end_date
+        self.daily_data = daily_data
+        self.rolling_std = rolling_std
+        self.avg_std = avg_std
+
+    @property
+    def last_date(self):
+        return pd.Timestamp(self.daily_data.index[-1]).date()
+
+    @property
+    def last_investment_date(self):
+        invested = self.daily_data.index[self.daily_data['equal_investment'].to_numpy() > 0]
+        return pd.Timestamp(invested[-1]).date() if len(invested) else None
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except Exception as e:
+            print(f"读取回测状态失败: {str(e)}")
+            return None
+        if getattr(state, 'version', None) != BacktestState.version:
+            return None
+        return state
+
+
+class BacktestEngine:
+    """
+    等额/加权定投回测引擎
+
+    指标列只计算一次，所有投资日的权重作为一个 NumPy 数组一次求出，
+    不依赖 Tk 或 matplotlib，可在 CLI 或后台线程中直接调用。
+    """
+
+    def __init__(self, base_investment=4000, sma_window=200, std_window=30, min_weight=0.8, max_weight=2):
+        self.base_investment = float(base_investment)
+        self.sma_window = int(sma_window)
+        self.std_window = int(std_window)
+        self.min_weight = min_weight
+        self.max_weight = max_weight
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(base_investment=config['base_investment'],
+                   sma_window=config['sma_window'],
+                   std_window=config['std_window'])
+
+    @property
+    def params(self):
+        return self.base_investment, self.sma_window, self.std_window, self.min_weight, self.max_weight
+
+    def compute_indicators(self, prices):
+        indicators = pd.DataFrame(index=prices.index)
+        indicators['std'] = prices.rolling(window=self.std_window).std()
+        indicators['avg_std'] = indicators['std'].expanding().mean()
+        return indicators
+
+    def run(self, prices, start_date, end_date):
+        """
+        对价格序列 prices 在 [start_date, end_date] 内执行每月定投回测
+
+        返回与 prices 同索引的每日数据，包含等权/加权的买入股数、投资额、
+        累计持股、累计投资、市值和累计收益；没有投资日时返回 None
+        """
+        result = self.run_with_state(prices, start_date, end_date)
+        return None if result is None else result[0]
+
+    def run_with_state(self, prices, start_date, end_date):
+        """与 run 相同，同时返回可用于 resume 的 BacktestState"""
+        prices = prices.astype(float)
+        if prices.empty or len(get_investment_positions(start_date, end_date, prices.index)) == 0:
+            return None
+
+        indicators = self.compute_indicators(prices)
+        std = indicators['std'].to_numpy()
+        avg_std = indicators['avg_std'].to_numpy()
+
+        scheduled = get_scheduled_dates(start_date, end_date)
+        daily_data = self._simulate(prices, std, avg_std, scheduled, carry=None)
+
+        # 用最后 std_window 个价格预热流式指标，供 resume 继续计算
+        rolling_std = RollingStd(self.std_window)
+        for price in prices.to_numpy()[-self.std_window:]:
+            rolling_std.update(price)
+        expanding_std = ExpandingMean()
+        valid = ~np.isnan(std)
+        expanding_std.total = float(std[valid].sum())
+        expanding_std.count = int(valid.sum())
+        expanding_std.value = float(avg_std[-1])
+
+        state = BacktestState(self.params, start_date, end_date, daily_data, rolling_std, expanding_std)
+        return self._finish(state), state
+
+    def resume(self, state, prices, end_date):
+        """
+        在 state 的基础上把回测延长到 end_date，只处理 state 之后新增的交易日
+
+        prices 需包含 state 最后一个交易日及之后的数据；参数不同、结束日期提前或
+        历史价格已变化（例如复权调整）时退回完整回测。返回 (daily_data, new_state)
+        """
+        prices = prices.astype(float)
+        if not self._can_resume(state, prices, end_date):
+            return self.run_with_state(prices, state.start_date, end_date)
+
+        last_date = state.last_date
+        new_prices = prices[to_day_array(prices.index) > np.datetime64(last_date, 'D')]
+        if new_prices.empty:
+            new_state = BacktestState(self.params, state.start_date, end_date, state.daily_data,
+                                      state.rolling_std, state.avg_std)
+            return self._finish(new_state), new_state
+
+        # 在状态的副本上逐个处理新增的价格，每个价格 O(1)
+        rolling_std = copy.deepcopy(state.rolling_std)
+        expanding_std = copy.deepcopy(state.avg_std)
+        values = new_prices.to_numpy()
+        std = np.empty(len(values))
+        avg_std = np.empty(len(values))
+        for i, price in enumerate(values):
+            std[i] = rolling_std.update(price)
+            avg_std[i] = expanding_std.update(std[i])
+
+        scheduled = [d for d in get_scheduled_dates(state.start_date, end_date) if d > last_date]
+        last_row = state.daily_data.iloc[-1]
+        new_daily_data = self._simulate(new_prices, std, avg_std, scheduled, carry=last_row)
+
+        new_state = BacktestState(self.params, state.start_date, end_date,
+                                  pd.concat([state.daily_data, new_daily_data]), rolling_std, expanding_std)
+        return self._finish(new_state), new_state
+
+    def _can_resume(self, state, prices, end_date):
+        if state is None or state.params != self.params or end_date < state.end_date:
+            return False
+        days = to_day_array(prices.index)
+        position = np.searchsorted(days, np.datetime64(state.last_date, 'D'))
+        if position >= len(days) or days[position] != np.datetime64(state.last_date, 'D'):
+            return False
+        return np.isclose(prices.iloc[position], state.daily_data['price'].iloc[-1], rtol=1e-9, atol=0)
+
+    def _simulate(self, prices, std, avg_std, scheduled, carry):
+        """计算计划日期不晚于最后一个交易日的投资，carry 为之前的累计数据"""
+        values = prices.to_numpy(dtype=float)
+        count = len(values)
+        base_investment = self.base_investment
+        days = to_day_array(prices.index)
+
+        scheduled = np.array(scheduled, dtype='datetime64[D]')
+        positions = np.searchsorted(days, scheduled[scheduled <= days[-1]], side='left')
+
+        invest_prices = values[positions]
+        weights = compute_weights(std[positions], avg_std[positions], self.min_weight, self.max_weight)
+
+        equal_investment = np.zeros(count)
+        weighted_investment = np.zeros(count)
+        equal_shares = np.zeros(count)
+        weighted_shares = np.zeros(count)
+
+        equal_investment[positions] = base_investment
+        weighted_investment[positions] = base_investment * weights
+        equal_shares[positions] = base_investment / invest_prices
+        weighted_shares[positions] = base_investment * weights / invest_prices
+
+        columns = {
+            'price': values,
+            'equal_shares': equal_shares,
+            'weighted_shares': weighted_shares,
+            'equal_investment': equal_investment,
+            'weighted_investment': weighted_investment,
+        }
+        for strategy in ('equal', 'weighted'):
+            shares = np.cumsum(columns[f'{strategy}_shares'])
+            investment = np.cumsum(columns[f'{strategy}_investment'])
+            if carry is not None:
+                shares += carry[f'{strategy}_cumulative_shares']
+                investment += carry[f'{strategy}_cumulative_investment']
+            columns[f'{strategy}_cumulative_shares'] = shares
+            columns[f'{strategy}_cumulative_investment'] = investment
+        return self._add_value_columns(pd.DataFrame(columns, index=prices.index))
+
+    @staticmethod
+    def _add_value_columns(daily_data):
+        for strategy in ('equal', 'weighted'):
+            market_value = daily_data[f'{strategy}_cumulative_shares'] * daily_data['price']
+            daily_data[f'{strategy}_market_value'] = market_value
+            daily_data[f'{strategy}_cumulative_return'] = market_value - daily_data[f'{strategy}_cumulative_investment']
+        return daily_data
+
+    def _finish(self, state):
+        """
+        计划日期晚于最后一个交易日的投资记在最后一个交易日上（与 get_investment_dates 一致），
+        只作用于返回结果，不写入状态
+        """
+        daily_data = state.daily_data.copy()
+        pending = any(d > state.last_date for d in get_scheduled_dates(state.start_date, state.end_date))
+        if not pending or daily_data['equal_investment'].iloc[-1] > 0:
+            return daily_data
+
+        price = daily_data['price'].iloc[-1]
+        weight = float(compute_weights(state.rolling_std.value, state.avg_std.value, self.min_weight, self.max_weight))
+        last = daily_data.index[-1]
+        for strategy, amount in (('equal', self.base_investment), ('weighted', self.base_investment * weight)):
+            daily_data.loc[last, f'{strategy}_shares'] = amount / price
+            daily_data.loc[last, f'{strategy}_investment'] = amount
+            daily_data.loc[last, f'{strategy}_cumulative_shares'] += amount / price
+            daily_data.loc[last, f'{strategy}_cumulative_investment'] += amount
+        return self._add_value_columns(daily_data)
+
+
+def accumulate_portfolio(prices, positions, allocations, base_investment):
+    """
+    按配置比例在每个投资日买入组合中的各个标的
+
+    prices 为 (交易日, 标的) 价格矩阵，positions 为投资日所在的行，allocations 为各标的配置比例。
+    每个 投资日×标的 的买入只记录一次，持仓由累加得到，组合市值由持仓与价格逐行求积和得到。
+    某个标的在投资日没有价格时跳过该次买入。
+    """
+    prices = np.asarray(prices, dtype=float)
+    positions = np.asarray(positions, dtype=int)
+    allocations = np.asarray(allocations, dtype=float)
+
+    invest_prices = prices[positions]
+    allocation_amounts = base_investment * allocations
+    valid = ~np.isnan(invest_prices) & (allocations != 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        purchase_shares = np.where(valid, np.ceil(allocation_amounts / invest_prices), 0.0)
+    purchase_cost = purchase_shares * np.where(valid, invest_prices, 0.0)
+
+    daily_shares = np.zeros_like(prices)
+    daily_cost = np.zeros_like(prices)
+    # 同一行可能出现多次（投资日超出数据范围时会落在最后一个交易日）
+    np.add.at(daily_shares, positions, purchase_shares)
+    np.add.at(daily_cost, positions, purchase_cost)
+
+    shares = np.cumsum(daily_shares, axis=0)
+    cost = np.cumsum(daily_cost, axis=0)
+    # 未持有的标的不计入市值，避免缺失价格污染组合价值
+    held_prices = np.where(shares > 0, prices, 0.0)
+    value = np.einsum('ij,ij->i', shares, held_prices)
+
+    return {
+        'purchase_prices': invest_prices,
+        'purchase_shares': purchase_shares,
+        'purchase_cost': purchase_cost,
+        'purchased': valid,
+        'shares': shares,
+        'cost': cost,
+        'value': value,
+        'total_cost': cost.sum(axis=1),
+    }
+
+
+def summarize_backtest(daily_data, start_date, end_date):
+    """
+    计算等额/加权定投的摘要统计，字段与 InvestmentApp.create_summary_statistics 一致
+    """
+    investment_period_days = (end_date - start_date).days
+    summary = {}
+    for strategy in ('equal', 'weighted'):
+        total_investment = float(daily_data[f'{strategy}_investment'].sum())
+        final_value = float(daily_data[f'{strategy}_market_value'].iloc[-1])
+        if total_investment > 0:
+            total_return = (final_value / total_investment - 1) * 100
+            annual_return = ((final_value / total_investment) ** (365.25 / investment_period_days) - 1) * 100
+        else:
+            total_return = 0
+            annual_return = 0
+        summary[f'{strategy}_total_investment'] = total_investment
+        summary[f'{strategy}_final_value'] = final_value
+        summary[f'{strategy}_cumulative_return'] = float(daily_data[f'{strategy}_cumulative_return'].iloc[-1])
+        summary[f'{strategy}_total_return'] = total_return
+        summary[f'{strategy}_annual_return'] = annual_return
+    return summary
@@ -0,0 +1,64 @@
+"""
+启动耗时基准测试
+
+    python benchmark_startup.py [--runs N]
+
+在临时目录中（没有保存的 token，不会访问网络）多次冷启动以下命令，输出最短和中位耗时，
+并检查 CLI 启动时是否导入了 GUI、绘图和行情下载模块。
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+MAIN_SCRIPT = os.path.join(PACKAGE_DIR, 'main.py')
+
+COMMANDS = {
+    'import main': [sys.executable, '-c', 'import main'],
+    'main.py --cli': [sys.executable, MAIN_SCRIPT, '--cli'],
+    # 临时目录中没有 token，--estimate 在检查登录状态后退出，测得的是该命令的启动耗时，不包括下载行情
+    'main.py --cli --estimate': [sys.executable, MAIN_SCRIPT, '--cli', '--estimate'],
+}
+
+# CLI 启动时不应加载的模块（GUI、绘图和行情下载）
+HEAVY_MODULES = ['tkinter', 'matplotlib', 'yfinance']
+
+
+def measure(command, runs, cwd, env):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def loaded_heavy_modules(cwd, env):
+    code = ('import sys, main; main.InvestmentApp(None); '
+            f'print("modules:" + ",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', code], cwd=cwd, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return output.rsplit('modules:', 1)[-1].strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold start time of the CLI")
+    parser.add_argument("--runs", type=int, default=5, help="Number of runs per command")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=PACKAGE_DIR)
+    with tempfile.TemporaryDirectory() as cwd:
+        width = max(len(name) for name in COMMANDS)
+        for name, command in COMMANDS.items():
+            timings = measure(command, args.runs, cwd, env)
+            print(f"{name:<{width}} 最短 {min(timings):.3f}s  中位 {statistics.median(timings):.3f}s")
+        modules = loaded_heavy_modules(cwd, env)
+        print(f"CLI 启动时加载的重量级模块: {modules or '无'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,505 @@
+import matplotlib.dates as mdates
+import numpy as np
+import pandas as pd
+from matplotlib.artist import Artist
+from matplotlib.backends.backend_agg import RendererAgg
+from matplotlib.figure import Figure
+from matplotlib.legend import Legend
+from matplotlib.patches import PathPatch
+from matplotlib.path import Path
+from matplotlib.text import Text
+
+from decimation import bar_vertices, histogram_bars, minmax_decimate, visible_slice
+
+# 滚轮每格的缩放比例
+ZOOM_STEP = 0.8
+# 放大后 x 轴至少显示的天数
+MIN_SPAN_DAYS = 10
+
+
+def to_date_numbers(index):
+    """把日期索引转换为 matplotlib 的日期数值"""
+    return mdates.date2num(pd.DatetimeIndex(index).to_pydatetime())
+
+
+def nearest_index(x, value):
+    """有序数组 x 中离 value 最近的元素的下标（二分查找）"""
+    i = int(np.searchsorted(x, value))
+    if i == 0:
+        return 0
+    if i == len(x):
+        return len(x) - 1
+    return i - 1 if value - x[i - 1] <= x[i] - value else i
+
+
+class CachedOverlay(Artist):
+    """
+    缓存为图片的静态图层
+
+    摘要和图例的内容与位置只在分析完成或画布大小变化时改变，它们的文字却占了一次完整绘制的大部分时间。
+    第一次绘制时把这些图形元素渲染到一张透明的 RGBA 图片中，之后每次绘制只贴图；
+    导出为 PDF/SVG 等矢量格式时仍直接绘制原来的图形元素。
+    """
+
+    def __init__(self, artists=()):
+        super().__init__()
+        self.set_zorder(1)
+        self.set_in_layout(False)
+        self._artists = list(artists)
+        self._cache_key = None
+        self._image = None
+
+    def set_artists(self, artists):
+        self._artists = list(artists)
+        self.invalidate()
+
+    def invalidate(self):
+        self._cache_key = None
+        self._image = None
+        self.stale = True
+
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+        if not isinstance(renderer, RendererAgg):
+            for artist in self._artists:
+                artist.draw(renderer)
+            return
+        # 画布大小、分辨率或坐标轴位置变化后重新渲染
+        key = (renderer.width, renderer.height, renderer.dpi,
+               tuple(tuple(ax.bbox.bounds) for ax in self.figure.axes))
+        if key != self._cache_key:
+            self._image = self._render(renderer)
+            self._cache_key = key
+        if self._image is not None:
+            x, y, image = self._image
+            gc = renderer.new_gc()
+            renderer.draw_image(gc, x, y, image)
+            gc.restore()
+        self.stale = False
+
+    def _render(self, renderer):
+        """在同样大小的透明画布上绘制图形元素，裁剪出不透明的部分，返回 (x, y, image)"""
+        offscreen = RendererAgg(int(renderer.width), int(renderer.height), renderer.dpi)
+        for artist in self._artists:
+            artist.draw(offscreen)
+        pixels = np.asarray(offscreen.buffer_rgba())
+        alpha = pixels[..., 3]
+        rows = np.flatnonzero(alpha.any(axis=1))
+        columns = np.flatnonzero(alpha.any(axis=0))
+        if len(rows) == 0:
+            return None
+        # 缓冲区第一行是画布顶部，draw_image 的图片第一行在底部
+        image = pixels[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1][::-1].copy()
+        return columns[0], int(renderer.height) - rows[-1] - 1, image
+
+
+class ChartView:
+    """
+    持久的分析图表
+
+    Figure、画布和所有图形元素只创建一次，每次分析完成后通过 set_data / set_text 更新数据，
+    内存占用不随刷新次数增长。不使用 pyplot，图表不会被 pyplot 的全局状态持有。
+
+    完整的数据保存在 _series 中，折线和柱状图只画当前可见范围内、按像素抽稀后的点；
+    x 轴范围或画布大小变化时重新抽稀，放大后自动显示更多细节。
+
+    交互：滚轮以鼠标位置为中心缩放，左键拖动平移，双击恢复完整区间；
+    鼠标悬停时显示最近交易日的价格、持仓份额和收益，悬停提示通过 blit 只重绘提示本身。
+    缩放和拖动时只重绘两个坐标轴（draw_axes），摘要和图例由 CachedOverlay 缓存为图片；
+    鼠标事件只记录新的显示区间，由事件循环空闲时的单次定时器统一重绘，
+    重绘期间积压的事件合并为一帧，绘制跟不上鼠标时不会越积越多。
+    """
+
+    def __init__(self, figure=None):
+        self.figure = figure or Figure(figsize=(8, 7))
+        self.ax1, self.ax2 = self.figure.subplots(2, 1, sharex=True, gridspec_kw={'height_ratios': [2, 1]})
+        self.figure.subplots_adjust(hspace=0.1, bottom=0.12, top=0.92, left=0.12, right=0.92)
+        self.canvas = None
+        self.widget = None
+        self._background = None
+        self._series = {}
+        self._macd_days = np.empty(0)
+        self._histogram_values = np.empty(0)
+        self._details = None
+        self._full_range = None
+        self._pan_start = None
+        self._hover_index = None
+        # 等待重绘的显示区间，以及重绘后需要显示提示的位置
+        self._pending_view = None
+        self._pending_tooltip = None
+        self._view_timer = None
+        self._build()
+        self.ax2.callbacks.connect('xlim_changed', self._on_xlim_changed)
+
+    def _build(self):
+        ax1, ax2 = self.ax1, self.ax2
+
+        # 累计收益
+        self.equal_line, = ax1.plot([], [], label='等权', color='orange')
+        self.weighted_line, = ax1.plot([], [], label='加权', color='blue')
+        self.portfolio_line, = ax1.plot([], [], label='组合', color='green')
+        ax1.set_ylabel('收益($)', fontsize=8)
+        ax1.grid(True, alpha=0.3)
+        ax1.tick_params(axis='both', which='major', labelsize=7)
+        ax1.tick_params(axis='both', which='minor', labelsize=6)
+        ax1.axhline(y=0, color='red', linestyle=':', linewidth=0.8)
+
+        # 终点标记和注释
+        self.endpoints = {}
+        for name, line in (('equal', self.equal_line), ('weighted', self.weighted_line),
+                           ('portfolio', self.portfolio_line)):
+            marker, = ax1.plot([], [], 'o', color=line.get_color(), markersize=4.5, label='_nolegend_')
+            annotation = ax1.annotate('', (0, 0), textcoords="offset points", xytext=(0, 5), ha='center',
+                                      fontsize=7)
+            self.endpoints[name] = (line, marker, annotation)
+
+        # 摘要信息显示在图表左侧；摘要和图例不加入坐标轴，由 overlay 缓存为图片后绘制
+        self.summary_text = Text(0.02, 0.98, '', transform=ax1.transAxes,
+                                 verticalalignment='top', horizontalalignment='left',
+                                 bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5),
+                                 fontsize=5.5, linespacing=0.95)
+        self.summary_text.set_figure(self.figure)
+        self.overlay = CachedOverlay([self.summary_text])
+        self.figure.add_artist(self.overlay)
+
+        # MACD
+        self.macd_line, = ax2.plot([], [], label='MACD', color='blue')
+        self.signal_line, = ax2.plot([], [], label='Signal', color='red')
+        # 柱状图的所有矩形合并为一条复合路径，一次绘制完成，而不是每个交易日一个 Rectangle
+        self.histogram = PathPatch(Path(np.empty((0, 2))), facecolor='gray', edgecolor='none', alpha=0.5,
+                                   label='Hist')
+        ax2.add_patch(self.histogram)
+        ax2.axhline(y=0, color='black', linestyle='--', linewidth=0.5)
+        ax2.set_ylabel('MACD', fontsize=8)
+        ax2.grid(True, alpha=0.3)
+
+        # x轴属性：刻度随缩放的范围自动调整
+        ax2.xaxis_date()
+        ax2.set_xlabel('日期', fontsize=8)
+        # 顶部没有刻度标签，固定标题位置，省去每次绘制时按刻度标签调整标题位置的计算
+        for ax in (ax1, ax2):
+            ax.set_title('', y=1.0)
+        locator = mdates.AutoDateLocator(minticks=3, maxticks=8)
+        ax2.xaxis.set_major_locator(locator)
+        ax2.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+        ax2.tick_params(axis='x', which='major', labelsize=6, labelrotation=45)
+
+        # 悬停提示：animated 的图形元素不参与完整绘制，只通过 blit 更新
+        self.cursor_lines = [ax.axvline(0, color='gray', linewidth=0.8, linestyle='--', animated=True,
+                                        visible=False) for ax in (ax1, ax2)]
+        self.cursor_marker, = ax1.plot([], [], 'o', color='black', markersize=3.5, animated=True, visible=False,
+                                       label='_nolegend_')
+        self.tooltip = self.figure.text(0, 0, '', fontsize=7, multialignment='left', animated=True, visible=False,
+                                        bbox=dict(boxstyle='round', facecolor='white', alpha=0.9))
+        self.hover_artists = self.cursor_lines + [self.cursor_marker, self.tooltip]
+
+    def attach(self, master):
+        """在 Tk 容器中创建画布并绑定鼠标交互，只需调用一次"""
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+        self.canvas.mpl_connect('resize_event', self._on_resize)
+        self.canvas.mpl_connect('scroll_event', self._on_scroll)
+        self.canvas.mpl_connect('button_press_event', self._on_press)
+        self.canvas.mpl_connect('button_release_event', self._on_release)
+        self.canvas.mpl_connect('motion_notify_event', self._on_motion)
+        self.canvas.mpl_connect('figure_leave_event', self._on_leave)
+        self._view_timer = self.canvas.new_timer(interval=0)
+        self._view_timer.single_shot = True
+        self._view_timer.add_callback(self.apply_view)
+        self.widget = self.canvas.get_tk_widget()
+        return self.widget
+
+    def update(self, ticker, start_date, end_date, data, daily_data, portfolio_returns, summary):
+        days = to_date_numbers(daily_data.index)
+        self._series = {
+            self.equal_line: (days, daily_data['equal_cumulative_return'].to_numpy(dtype=float)),
+            self.weighted_line: (days, daily_data['weighted_cumulative_return'].to_numpy(dtype=float)),
+        }
+        if portfolio_returns is not None and len(portfolio_returns) > 0:
+            self._series[self.portfolio_line] = (to_date_numbers(portfolio_returns.index),
+                                                 portfolio_returns.to_numpy(dtype=float))
+            self.portfolio_line.set_visible(True)
+        else:
+            self.portfolio_line.set_data([], [])
+            self.portfolio_line.set_visible(False)
+
+        # 悬停提示使用的逐日数据
+        self._details = {
+            'days': days,
+            'price': daily_data['price'].to_numpy(dtype=float),
+            'equal_shares': daily_data['equal_cumulative_shares'].to_numpy(dtype=float),
+            'weighted_shares': daily_data['weighted_cumulative_shares'].to_numpy(dtype=float),
+        }
+
+        for line, marker, annotation in self.endpoints.values():
+            x, y = self._series.get(line, ((), ()))
+            if len(x):
+                marker.set_data([x[-1]], [y[-1]])
+                annotation.xy = (x[-1], y[-1])
+                annotation.set_text(f'{y[-1]:.0f}')
+                marker.set_visible(True)
+                annotation.set_visible(True)
+            else:
+                marker.set_visible(False)
+                annotation.set_visible(False)
+
+        self.ax1.set_title(f'{ticker}累计收益({start_date.year}-{end_date.year})', fontsize=9, y=1.0)
+        handles = [self.equal_line, self.weighted_line] + ([self.portfolio_line]
+                                                           if self.portfolio_line.get_visible() else [])
+        legend = Legend(self.ax1, handles, [handle.get_label() for handle in handles], fontsize=7, loc='upper left',
+                        framealpha=0.7)
+
+        self.summary_text.set_text(summary)
+
+        # MACD
+        macd_days = to_date_numbers(data.index)
+        macd = data[f'{ticker}_MACD'].to_numpy(dtype=float)
+        signal = data[f'{ticker}_MACD_SIGNAL'].to_numpy(dtype=float)
+        self._series[self.macd_line] = (macd_days, macd)
+        self._series[self.signal_line] = (macd_days, signal)
+        self._macd_days = macd_days
+        self._histogram_values = np.nan_to_num(macd - signal)
+        macd_handles = [self.macd_line, self.signal_line, self.histogram]
+        macd_legend = Legend(self.ax2, macd_handles, [handle.get_label() for handle in macd_handles],
+                             loc='upper left', fontsize=6)
+        self.overlay.set_artists([self.summary_text, legend, macd_legend])
+
+        # 设置 x 轴范围时触发 _on_xlim_changed，按新的范围生成折线和柱状图并调整 y 轴
+        self._full_range = (macd_days[0], macd_days[-1])
+        self._pending_view = None
+        self._pending_tooltip = None
+        self.hide_tooltip()
+        self.ax2.set_xlim(*self._full_range)
+
+        # 确保图表不会超出边界
+        self.figure.tight_layout(pad=0.5)
+
+    def refresh_detail(self):
+        """
+        按当前 x 轴范围和坐标轴的像素宽度重新抽稀折线和 MACD 柱状图，并让 y 轴适应可见的数据
+
+        每个像素最多保留 4 个点（折线）或 1 根柱（柱状图），长区间和短区间的绘制量相同
+        """
+        start, end = self.ax2.get_xlim()
+        bins = max(int(self.ax2.bbox.width), 1)
+        for line, (x, y) in self._series.items():
+            visible = visible_slice(x, start, end)
+            line.set_data(*minmax_decimate(x[visible], y[visible], bins))
+
+        visible = visible_slice(self._macd_days, start, end)
+        left, right, bottom, top = histogram_bars(self._macd_days[visible], self._histogram_values[visible], bins)
+        self.histogram.set_path(Path.make_compound_path_from_polys(bar_vertices(left, right, bottom, top)))
+
+        self._fit_y(self.ax1, [self.equal_line, self.weighted_line, self.portfolio_line], (), 0.1)
+        self._fit_y(self.ax2, [self.macd_line, self.signal_line], (bottom, top, [0]), 0.05)
+
+    def _fit_y(self, ax, lines, extra, margin):
+        """y 轴范围包含所有可见的数据点，上下各留 margin 比例的空白"""
+        values = [np.asarray(line.get_ydata(), dtype=float) for line in lines if line.get_visible()]
+        values = np.concatenate(values + [np.asarray(v, dtype=float) for v in extra])
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        y_min, y_max = values.min(), values.max()
+        padding = margin * (y_max - y_min) or 1
+        ax.set_ylim(y_min - padding, y_max + padding)
+
+    def set_view(self, start, end):
+        """
+        显示 [start, end] 区间，限制在数据范围内
+
+        有画布时只记录区间，由定时器在事件循环空闲时调用 apply_view，连续的鼠标事件只重绘一次；
+        没有画布时立即生效
+        """
+        if self._full_range is None:
+            return
+        low, high = self._full_range
+        span = min(max(end - start, MIN_SPAN_DAYS), high - low)
+        start = min(max(start, low), high - span)
+        self._pending_view = (start, start + span)
+        if self._view_timer is None:
+            self.apply_view()
+        else:
+            self._view_timer.start()
+
+    def current_view(self):
+        """当前的显示区间，包括还没有重绘的区间"""
+        return self._pending_view or tuple(self.ax2.get_xlim())
+
+    def apply_view(self):
+        """应用最近一次 set_view 的区间：重新抽稀由 xlim_changed 回调完成，只重绘坐标轴"""
+        if self._pending_view is None:
+            return
+        self.ax2.set_xlim(*self._pending_view)
+        self._pending_view = None
+        if self._pending_tooltip is not None:
+            # 缩放后鼠标位置对应的交易日不变，提示随坐标轴一起画出
+            self.show_tooltip(self._pending_tooltip)
+            self._pending_tooltip = None
+        self.draw_axes()
+
+    def reset_view(self):
+        if self._full_range is not None:
+            self.set_view(*self._full_range)
+
+    def show_tooltip(self, xdata):
+        """
+        在离 xdata 最近的交易日处显示详情
+
+        用二分查找定位交易日，不随数据长度线性增长；返回提示是否需要重绘（交易日没有变化时不需要）
+        """
+        if self._details is None:
+            return False
+        days = self._details['days']
+        i = nearest_index(days, xdata)
+        if i == self._hover_index and self.tooltip.get_visible():
+            return False
+        self._hover_index = i
+        day = days[i]
+
+        lines = [mdates.num2date(day).strftime('%Y-%m-%d'), f"价格: {self._details['price'][i]:.2f}"]
+        marker_y = []
+        for name, label, line in (('equal', '等权', self.equal_line), ('weighted', '加权', self.weighted_line)):
+            value = self._series[line][1][i]
+            lines.append(f"{label}: {self._details[f'{name}_shares'][i]:.4f} 股  收益 ${value:,.2f}")
+            marker_y.append(value)
+        if self.portfolio_line in self._series:
+            portfolio_days, portfolio_values = self._series[self.portfolio_line]
+            j = nearest_index(portfolio_days, day)
+            if portfolio_days[j] == day and np.isfinite(portfolio_values[j]):
+                lines.append(f"组合: 收益 ${portfolio_values[j]:,.2f}")
+                marker_y.append(portfolio_values[j])
+
+        for cursor_line in self.cursor_lines:
+            cursor_line.set_xdata([day, day])
+            cursor_line.set_visible(True)
+        self.cursor_marker.set_data([day] * len(marker_y), marker_y)
+        self.cursor_marker.set_visible(True)
+
+        # 提示显示在竖线旁、累计收益图的顶部；靠近右侧时显示在竖线左边，避免超出画布
+        x = self.ax1.transData.transform((day, 0))[0]
+        width, height = self.figure.bbox.width, self.figure.bbox.height
+        right_side = x > self.ax1.bbox.x0 + self.ax1.bbox.width * 0.6
+        self.tooltip.set_text('\n'.join(lines))
+        self.tooltip.set_position(((x + (-8 if right_side else 8)) / width, (self.ax1.bbox.y1 - 8) / height))
+        self.tooltip.set_horizontalalignment('right' if right_side else 'left')
+        self.tooltip.set_verticalalignment('top')
+        self.tooltip.set_visible(True)
+        return True
+
+    def hide_tooltip(self):
+        """隐藏悬停提示，返回提示之前是否可见"""
+        visible = self.tooltip.get_visible()
+        self._hover_index = None
+        for artist in self.hover_artists:
+            artist.set_visible(False)
+        return visible
+
+    def draw(self):
+        if self.canvas is not None:
+            self.canvas.draw_idle()
+
+    def draw_axes(self):
+        """
+        立即重绘两个坐标轴和缓存的摘要、图例，用于缩放和拖动时的逐帧更新
+
+        坐标轴以外只有背景色，清空画布后依次画上背景、坐标轴和 overlay 即可，
+        省去完整绘制的布局计算；还没有完整绘制过时退回 draw。
+        """
+        if self.canvas is None or self._background is None:
+            self.draw()
+            return
+        self.canvas.get_renderer().clear()
+        for artist in (self.figure.patch, self.ax1, self.ax2, self.overlay):
+            self.figure.draw_artist(artist)
+        self._save_background()
+        self.canvas.blit(self.figure.bbox)
+
+    def blit(self, artists):
+        """
+        只重绘 artists：恢复上次完整绘制时保存的背景，再画上这些图形元素
+
+        用于悬停提示等频繁变化的内容，背景在每次完整绘制后自动更新
+        """
+        if self.canvas is None or self._background is None:
+            self.draw()
+            return
+        self.canvas.restore_region(self._background)
+        for artist in artists:
+            self.figure.draw_artist(artist)
+        self.canvas.blit(self.figure.bbox)
+
+    def close(self):
+        """释放画布和图表"""
+        if self.widget is not None:
+            self.widget.destroy()
+            self.widget = None
+        if self._view_timer is not None:
+            self._view_timer.stop()
+            self._view_timer = None
+        self.canvas = None
+        self._background = None
+        self.figure.clear()
+
+    def _on_xlim_changed(self, ax):
+        self.refresh_detail()
+
+    def _on_resize(self, event):
+        self.refresh_detail()
+
+    def _on_draw(self, event):
+        self._save_background()
+
+    def _save_background(self):
+        # 保存不含悬停提示的背景，再把可见的提示画上去
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        for artist in self.hover_artists:
+            if artist.get_visible():
+                self.figure.draw_artist(artist)
+
+    def _on_scroll(self, event):
+        if event.inaxes not in (self.ax1, self.ax2) or event.xdata is None:
+            return
+        # 上一次缩放可能还没有重绘，按记录的区间换算鼠标位置对应的日期
+        start, end = self.current_view()
+        xdata = start + (event.x - self.ax2.bbox.x0) / self.ax2.bbox.width * (end - start)
+        scale = ZOOM_STEP ** event.step
+        self.hide_tooltip()
+        self._pending_tooltip = xdata
+        self.set_view(xdata - (xdata - start) * scale, xdata + (end - xdata) * scale)
+
+    def _on_press(self, event):
+        if event.button != 1 or event.inaxes not in (self.ax1, self.ax2):
+            return
+        if event.dblclick:
+            self.reset_view()
+            return
+        self._pan_start = (event.x, self.current_view())
+        self._pending_tooltip = None
+        self.hide_tooltip()
+
+    def _on_release(self, event):
+        self._pan_start = None
+
+    def _on_motion(self, event):
+        if self._pan_start is not None:
+            # 按鼠标移动的像素换算平移的天数
+            x, (start, end) = self._pan_start
+            shift = (x - event.x) * (end - start) / self.ax2.bbox.width
+            self.set_view(start + shift, end + shift)
+            return
+        if self._pending_view is not None:
+            # 等待重绘时坐标变换还是旧的区间，提示在重绘后随下一次鼠标移动更新
+            return
+        if event.inaxes in (self.ax1, self.ax2):
+            if self.show_tooltip(event.xdata):
+                self.blit(self.hover_artists)
+        elif self.hide_tooltip():
+            self.blit([])
+
+    def _on_leave(self, event):
+        if self.hide_tooltip():
+            self.blit([])
@@ -0,0 +1,65 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+# 行情数据实际使用的 Yahoo Finance 接口
+YAHOO_ENDPOINTS = [
+    'https://query1.finance.yahoo.com',
+    'https://query2.finance.yahoo.com',
+]
+
+
+class ConnectivityChecker:
+    """
+    网络连通性检测
+
+    并发探测 endpoints，任意一个返回响应即视为在线；结果在 ttl 秒内复用，
+    同一时间只有一个线程执行探测，其他线程等待并共享结果。
+    """
+
+    def __init__(self, endpoints=None, timeout=3, ttl=60):
+        self.endpoints = list(endpoints or YAHOO_ENDPOINTS)
+        self.timeout = timeout
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._online = None
+        self._checked_at = 0.0
+
+    def is_online(self, force=False):
+        with self._lock:
+            if not force and self._online is not None and time.time() - self._checked_at < self.ttl:
+                return self._online
+            self._online = self._probe_all()
+            self._checked_at = time.time()
+            return self._online
+
+    def invalidate(self):
+        """丢弃缓存的检测结果，下次调用 is_online 时重新探测"""
+        with self._lock:
+            self._online = None
+
+    def _probe_all(self):
+        executor = ThreadPoolExecutor(max_workers=len(self.endpoints))
+        try:
+            futures = [executor.submit(self._probe, endpoint) for endpoint in self.endpoints]
+            for future in as_completed(futures):
+                if future.result():
+                    return True
+            print("无法连接到数据服务器: " + ', '.join(self.endpoints))
+            return False
+        finally:
+            # 已有结果时不等待其余探测完成
+            executor.shutdown(wait=False)
+
+    def _probe(self, endpoint):
+        try:
+            response = requests.head(endpoint, timeout=self.timeout, allow_redirects=True)
+        except requests.RequestException:
+            return False
+        # 服务器有响应即可访问，5xx 表示服务暂时不可用
+        if response.status_code < 500:
+            print(f"成功连接到 {endpoint}")
+            return True
+        return False
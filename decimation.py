@@ -0,0 +1,81 @@
+import numpy as np
+
+
+def pixel_bins(x, bins, start=None, end=None):
+    """
+    把有序的 x 按像素宽度等分为 bins 组
+
+    返回 (starts, edges, mask)：starts 是每组第一个点在 x 中的下标，edges 是 bins + 1 个分组边界，
+    mask 标记非空的组。
+    """
+    start = x[0] if start is None else start
+    end = x[-1] if end is None else end
+    edges = np.linspace(start, end, bins + 1)
+    starts = np.searchsorted(x, edges[:-1], side='left')
+    stops = np.append(starts[1:], np.searchsorted(x, end, side='right'))
+    return starts, edges, stops > starts
+
+
+def histogram_bars(x, values, bins, width=0.8):
+    """
+    柱状图的矩形 (left, right, bottom, top)
+
+    点数不超过 bins 时每个点一根宽度为 width 的柱；否则每个像素合并为一根柱，
+    高度取该像素内的最大正值和最小负值，长区间的峰值不会因合并而丢失。
+    """
+    x = np.asarray(x, dtype=float)
+    values = np.nan_to_num(np.asarray(values, dtype=float))
+    if len(x) == 0:
+        empty = np.empty(0)
+        return empty, empty, empty, empty
+    if len(x) <= bins:
+        return x - width / 2, x + width / 2, np.minimum(values, 0), np.maximum(values, 0)
+
+    starts, edges, mask = pixel_bins(x, bins)
+    starts = starts[mask]
+    top = np.maximum(np.maximum.reduceat(values, starts), 0)
+    bottom = np.minimum(np.minimum.reduceat(values, starts), 0)
+    return edges[:-1][mask], edges[1:][mask], bottom, top
+
+
+def bar_vertices(left, right, bottom, top):
+    """把矩形转换为多边形顶点数组，形状为 (n, 4, 2)"""
+    xs = np.stack([left, left, right, right], axis=1)
+    ys = np.stack([bottom, top, top, bottom], axis=1)
+    return np.stack([xs, ys], axis=2)
+
+
+def visible_slice(x, start, end):
+    """x 中落在 [start, end] 内的点的切片，两端各多保留一个点，使折线延伸到坐标轴边缘"""
+    lo = max(np.searchsorted(x, start, side='left') - 1, 0)
+    hi = min(np.searchsorted(x, end, side='right') + 1, len(x))
+    return slice(lo, hi)
+
+
+def minmax_decimate(x, y, bins):
+    """
+    按像素抽稀折线，返回 (x, y)
+
+    每个像素保留第一个点、最后一个点以及最小值和最大值所在的点（按原顺序），
+    画出来的折线与原始数据在像素级别上一致，最多 4 * bins 个点。NaN 点不会被选为极值。
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) <= 4 * bins:
+        return x, y
+
+    starts, _, mask = pixel_bins(x, bins)
+    starts = starts[mask]
+    stops = np.append(starts[1:], len(x))
+    bin_ids = np.repeat(np.arange(len(starts)), stops - starts)
+
+    nan = np.isnan(y)
+    indices = [starts, stops - 1]
+    for filled, reduce in ((np.where(nan, np.inf, y), np.minimum), (np.where(nan, -np.inf, y), np.maximum)):
+        # 每组中第一个等于组内极值的点
+        extreme = reduce.reduceat(filled, starts)
+        hits = np.flatnonzero(filled == extreme[bin_ids])
+        _, first = np.unique(bin_ids[hits], return_index=True)
+        indices.append(hits[first])
+    indices = np.unique(np.concatenate(indices))
+    return x[indices], y[indices]
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import platform
+
+from matplotlib import font_manager
+
+# 各操作系统按优先级排列的中文字体
+CJK_FONT_CANDIDATES = {
+    'Windows': ['Microsoft YaHei', 'SimHei', 'SimSun', 'Arial Unicode MS'],
+    'Darwin': ['PingFang HK', 'PingFang SC', 'Hiragino Sans GB', 'STHeiti', 'Heiti SC', 'STSong', 'Songti SC',
+               'Arial Unicode MS'],
+    'Linux': ['WenQuanYi Micro Hei', 'WenQuanYi Zen Hei', 'Noto Sans CJK SC', 'Noto Sans SC', 'Source Han Sans SC',
+              'Droid Sans Fallback', 'AR PL UMing CN'],
+}
+DEFAULT_CANDIDATES = ['Arial Unicode MS']
+
+
+def get_font_candidates(system=None):
+    return CJK_FONT_CANDIDATES.get(system or platform.system(), DEFAULT_CANDIDATES)
+
+
+def _font_directories(system):
+    if system == 'Windows':
+        return [font_manager.win32FontDirectory()] + list(font_manager.MSUserFontDirectories)
+    if system == 'Darwin':
+        return list(font_manager.OSXFontDirectories)
+    return list(font_manager.X11FontDirectories)
+
+
+def font_set_key(system=None):
+    """
+    系统字体集合的指纹：字体目录及其子目录的修改时间
+
+    安装或删除字体会改变所在目录的修改时间，只需 stat 目录，不必读取字体文件
+    """
+    system = system or platform.system()
+    digest = hashlib.sha1(system.encode('utf-8'))
+    for directory in _font_directories(system):
+        for root, _, _ in os.walk(directory):
+            try:
+                mtime = os.stat(root).st_mtime_ns
+            except OSError:
+                continue
+            digest.update(f'{root}:{mtime}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class FontResolver:
+    """
+    选择可用的中文字体
+
+    第一次运行时在 matplotlib 已知的字体中查找候选字体，找不到时再扫描系统字体文件；
+    结果按系统字体集合的指纹保存在 cache_file 中，字体集合不变时之后的启动不再扫描。
+    """
+
+    def __init__(self, cache_file=os.path.join('cache', 'font.json'), system=None):
+        self.cache_file = cache_file
+        self.system = system or platform.system()
+
+    def resolve(self):
+        """返回可用的中文字体名称，没有可用字体时返回 None"""
+        key = font_set_key(self.system)
+        cached = self._load()
+        if cached.get('key') == key:
+            self._register(cached.get('path'))
+            return cached.get('family')
+
+        family, path = self._probe()
+        self._save({'key': key, 'family': family, 'path': path})
+        self._register(path)
+        return family
+
+    def _probe(self):
+        candidates = get_font_candidates(self.system)
+
+        # matplotlib 自身缓存了已安装字体的列表，优先在其中查找
+        known = {font.name: font.fname for font in font_manager.fontManager.ttflist}
+        for family in candidates:
+            if family in known:
+                return family, known[family]
+
+        # 不在 matplotlib 缓存中的新字体，逐个读取字体文件的名称
+        found = {}
+        for font_path in font_manager.findSystemFonts(fontpaths=None, fontext='ttf'):
+            try:
+                found.setdefault(font_manager.FontProperties(fname=font_path).get_name(), font_path)
+            except RuntimeError:
+                continue
+        for family in candidates:
+            if family in found:
+                return family, found[family]
+        return None, None
+
+    @staticmethod
+    def _register(path):
+        if not path or not os.path.exists(path):
+            return
+        if any(font.fname == path for font in font_manager.fontManager.ttflist):
+            return
+        try:
+            font_manager.fontManager.addfont(path)
+        except (OSError, RuntimeError) as e:
+            print(f"加载字体 {path} 失败: {str(e)}")
+
+    def _load(self):
+        if not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entry):
+        directory = os.path.dirname(self.cache_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.cache_file + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_file)
@@ -0,0 +1,219 @@
+import math
+from collections import deque
+
+
+class RollingMean:
+    """滚动均值，每个新价格 O(1) 更新；窗口未满或窗口内有缺失值时为 NaN"""
+
+    def __init__(self, window):
+        self.window = int(window)
+        self._values = deque()
+        self._sum = 0.0
+        self._nan_count = 0
+        self.value = math.nan
+
+    def update(self, x):
+        x = float(x)
+        self._push(x)
+        if len(self._values) > self.window:
+            self._pop(self._values.popleft())
+
+        if len(self._values) < self.window or self._nan_count:
+            self.value = math.nan
+        else:
+            self.value = self._sum / self.window
+        return self.value
+
+    def _push(self, x):
+        self._values.append(x)
+        if math.isnan(x):
+            self._nan_count += 1
+        else:
+            self._sum += x
+
+    def _pop(self, x):
+        if math.isnan(x):
+            self._nan_count -= 1
+        else:
+            self._sum -= x
+
+
+class RollingStd:
+    """滚动样本标准差 (ddof=1)，使用带删除的 Welford 算法，每个新价格 O(1) 更新"""
+
+    def __init__(self, window):
+        self.window = int(window)
+        self._values = deque()
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._nan_count = 0
+        self.value = math.nan
+
+    def update(self, x):
+        x = float(x)
+        self._values.append(x)
+        if math.isnan(x):
+            self._nan_count += 1
+        else:
+            self._add(x)
+        if len(self._values) > self.window:
+            old = self._values.popleft()
+            if math.isnan(old):
+                self._nan_count -= 1
+            else:
+                self._remove(old)
+
+        if len(self._values) < self.window or self._nan_count or self._count < 2:
+            self.value = math.nan
+        else:
+            self.value = math.sqrt(max(self._m2, 0.0) / (self._count - 1))
+        return self.value
+
+    def _add(self, x):
+        self._count += 1
+        delta = x - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (x - self._mean)
+
+    def _remove(self, x):
+        self._count -= 1
+        if self._count == 0:
+            self._mean = 0.0
+            self._m2 = 0.0
+            return
+        delta = x - self._mean
+        self._mean -= delta / self._count
+        self._m2 -= delta * (x - self._mean)
+
+
+class ExpandingMean:
+    """累计均值，忽略缺失值（与 pandas expanding().mean() 一致）"""
+
+    def __init__(self):
+        self.total = 0.0
+        self.count = 0
+        self.value = math.nan
+
+    def update(self, x):
+        x = float(x)
+        if not math.isnan(x):
+            self.total += x
+            self.count += 1
+        self.value = self.total / self.count if self.count else math.nan
+        return self.value
+
+
+class EMA:
+    """指数移动平均，与 pandas ewm(span=span, adjust=False) 一致"""
+
+    def __init__(self, span):
+        self.span = span
+        self.alpha = 2 / (span + 1)
+        self.value = math.nan
+
+    def update(self, x):
+        x = float(x)
+        if math.isnan(x):
+            return self.value
+        if math.isnan(self.value):
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+
+class MACD:
+    """MACD 指标，update 返回 (macd, signal, histogram)"""
+
+    def __init__(self, short_window=12, long_window=26, signal_window=9):
+        self.short_ema = EMA(short_window)
+        self.long_ema = EMA(long_window)
+        self.signal_ema = EMA(signal_window)
+        self.value = (math.nan, math.nan, math.nan)
+
+    def update(self, x):
+        macd = self.short_ema.update(x) - self.long_ema.update(x)
+        signal = self.signal_ema.update(macd)
+        self.value = (macd, signal, macd - signal)
+        return self.value
+
+
+class RSI:
+    """
+    相对强弱指标
+
+    method='simple' 使用涨跌幅的简单滚动均值，与 InvestmentApp.calculate_rsi 一致；
+    method='wilder' 使用 Wilder 平滑
+    """
+
+    def __init__(self, period=14, method='simple'):
+        if method not in ('simple', 'wilder'):
+            raise ValueError(f"不支持的 RSI 计算方法: {method}")
+        self.period = int(period)
+        self.method = method
+        self._previous = None
+        self._gain = RollingMean(period)
+        self._loss = RollingMean(period)
+        self._seen = 0
+        self._avg_gain = 0.0
+        self._avg_loss = 0.0
+        self.value = math.nan
+
+    def update(self, x):
+        x = float(x)
+        # 第一个价格没有涨跌，按 0 计入（与 calculate_rsi 中 delta.where(...) 的结果一致）
+        delta = 0.0 if self._previous is None else x - self._previous
+        self._previous = x
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+
+        if self.method == 'simple':
+            avg_gain = self._gain.update(gain)
+            avg_loss = self._loss.update(loss)
+        else:
+            self._seen += 1
+            if self._seen <= self.period:
+                self._avg_gain += gain / self.period
+                self._avg_loss += loss / self.period
+            else:
+                self._avg_gain = (self._avg_gain * (self.period - 1) + gain) / self.period
+                self._avg_loss = (self._avg_loss * (self.period - 1) + loss) / self.period
+            if self._seen < self.period:
+                avg_gain, avg_loss = math.nan, math.nan
+            else:
+                avg_gain, avg_loss = self._avg_gain, self._avg_loss
+
+        if math.isnan(avg_gain) or math.isnan(avg_loss) or (avg_gain == 0 and avg_loss == 0):
+            self.value = math.nan
+        elif avg_loss == 0:
+            self.value = 100.0
+        else:
+            self.value = 100 - 100 / (1 + avg_gain / avg_loss)
+        return self.value
+
+
+class TrendIndicators:
+    """calculate_weight 使用的市场趋势指标：50/200 日均线和 14 日 RSI"""
+
+    # 得到最新指标值所需的最少历史价格数
+    warmup = 200
+
+    def __init__(self):
+        self.sma_50 = RollingMean(50)
+        self.sma_200 = RollingMean(200)
+        self.rsi = RSI(14)
+
+    @classmethod
+    def from_history(cls, prices):
+        """只使用最近 warmup 个价格建立指标，结果与对完整序列计算的最新值相同"""
+        indicators = cls()
+        for price in list(prices)[-cls.warmup:]:
+            indicators.update(price)
+        return indicators
+
+    def update(self, price):
+        self.sma_50.update(price)
+        self.sma_200.update(price)
+        self.rsi.update(price)
+        return self
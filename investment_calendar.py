@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+
+def get_second_wednesday(date):
+    # 获取给定月份的第一天
+    first_day = date.replace(day=1)
+    # 找到第一个周三
+    first_wednesday = first_day + timedelta(days=(2 - first_day.weekday() + 7) % 7)
+    # 第二个周三
+    return first_wednesday + timedelta(days=7)
+
+
+def get_scheduled_dates(start_date, end_date):
+    """返回 [start_date, end_date] 内每月第二个周三的日期"""
+    scheduled = []
+    current_date = start_date.replace(day=1)
+    while current_date <= end_date:
+        investment_date = get_second_wednesday(current_date)
+        if start_date <= investment_date <= end_date:
+            scheduled.append(investment_date)
+        current_date = (current_date + timedelta(days=32)).replace(day=1)
+    return scheduled
@@ -0,0 +1,181 @@
+import bisect
+import json
+import os
+import pickle
+import threading
+from datetime import datetime
+
+# 快照之后累计多少条新记录时重写快照
+SNAPSHOT_INTERVAL = 100
+
+
+def _date_key(value, end=False):
+    """把 date/datetime 转换为与记录中 'date' 字段可比较的字符串"""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value.strftime('%Y-%m-%d') + (' 23:59:59' if end else ' 00:00:00')
+
+
+def make_record(ticker, date, price, shares, amount):
+    return {
+        'date': date.strftime('%Y-%m-%d %H:%M:%S'),
+        'ticker': ticker,
+        'price': float(price),  # 确保是 Python float
+        'shares': int(shares),  # 确保是 Python int
+        'amount': float(amount)  # 确保是 Python float
+    }
+
+
+class InvestmentLedger:
+    """
+    只追加的投资记录
+
+    每条记录作为一行 JSON 追加到 {name}.jsonl 并立即 fsync，新增记录的耗时与历史长度无关；
+    {name}.snapshot 保存已解析记录的二进制快照、按标的和日期排序的索引及其对应的文件偏移量，
+    加载时只需解析快照之后的行。首次使用时会导入旧版的 {name}.json 文件。
+    """
+
+    def __init__(self, name):
+        self.log_file = f'{name}.jsonl'
+        self.snapshot_file = f'{name}.snapshot'
+        self.legacy_file = f'{name}.json'
+        self._lock = threading.Lock()
+        self._records = None
+        # {ticker: ([按时间排序的日期], [对应的记录位置])}
+        self._index = {}
+        self._offset = 0
+        self._snapshot_count = 0
+        self._migrate_legacy()
+
+    def append(self, record):
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        with self._lock:
+            with open(self.log_file, 'ab') as f:
+                # 上次写入中断留下的半行不能与新记录连在一起
+                if f.tell() > 0 and not self._ends_with_newline():
+                    f.write(b'\n')
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+                end = f.tell()
+            if self._records is not None and self._offset == end - len(line):
+                self._add(record)
+                self._offset = end
+
+    def load(self):
+        """返回所有记录的列表（副本）"""
+        with self._lock:
+            self._refresh()
+            return list(self._records)
+
+    def tickers(self):
+        with self._lock:
+            self._refresh()
+            return list(self._index)
+
+    def query(self, ticker, start=None, end=None):
+        """
+        按索引返回 ticker 在 [start, end] 内按时间排序的记录，start/end 为 date 或 datetime，None 表示不限
+        """
+        with self._lock:
+            self._refresh()
+            if ticker not in self._index:
+                return []
+            dates, rows = self._index[ticker]
+            low = 0 if start is None else bisect.bisect_left(dates, _date_key(start))
+            high = len(dates) if end is None else bisect.bisect_right(dates, _date_key(end, end=True))
+            return [self._records[row] for row in rows[low:high]]
+
+    def compact(self):
+        """把当前所有记录写入快照"""
+        with self._lock:
+            self._refresh()
+            self._write_snapshot()
+
+    def _refresh(self):
+        if self._records is None:
+            self._read_snapshot()
+        if not os.path.exists(self.log_file):
+            return
+
+        with open(self.log_file, 'rb') as f:
+            f.seek(self._offset)
+            tail = f.read()
+        # 只处理完整的行，末尾未写完的半行留到下次
+        complete = tail[:tail.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            if not line.strip():
+                continue
+            try:
+                self._add(json.loads(line))
+            except ValueError:
+                print(f"跳过损坏的投资记录: {line[:80]!r}")
+        self._offset += len(complete)
+
+        if len(self._records) - self._snapshot_count >= SNAPSHOT_INTERVAL:
+            self._write_snapshot()
+
+    def _add(self, record):
+        dates, rows = self._index.setdefault(record['ticker'], ([], []))
+        position = bisect.bisect_right(dates, record['date'])
+        dates.insert(position, record['date'])
+        rows.insert(position, len(self._records))
+        self._records.append(record)
+
+    def _read_snapshot(self):
+        self._records = []
+        self._index = {}
+        self._offset = 0
+        self._snapshot_count = 0
+        if not os.path.exists(self.snapshot_file):
+            return
+        try:
+            with open(self.snapshot_file, 'rb') as f:
+                snapshot = pickle.load(f)
+        except Exception as e:
+            print(f"读取投资记录快照失败: {str(e)}，将重新解析记录文件")
+            return
+        log_size = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+        if snapshot['offset'] > log_size:
+            # 记录文件被替换或截断，快照失效
+            return
+        self._offset = snapshot['offset']
+        self._snapshot_count = len(snapshot['records'])
+        if 'index' in snapshot:
+            self._records = snapshot['records']
+            self._index = snapshot['index']
+        else:
+            # 旧版快照没有索引，重新建立
+            for record in snapshot['records']:
+                self._add(record)
+
+    def _write_snapshot(self):
+        tmp_path = self.snapshot_file + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'offset': self._offset, 'records': self._records, 'index': self._index}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.snapshot_file)
+        self._snapshot_count = len(self._records)
+
+    def _ends_with_newline(self):
+        with open(self.log_file, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _migrate_legacy(self):
+        if os.path.exists(self.log_file) or not os.path.exists(self.legacy_file):
+            return
+        try:
+            with open(self.legacy_file, 'r') as f:
+                history = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取旧版投资记录失败: {str(e)}")
+            return
+        tmp_path = self.log_file + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in history:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.log_file)
+        print(f"已将 {self.legacy_file} 中的 {len(history)} 条投资记录导入 {self.log_file}")
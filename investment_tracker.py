@@ -1,44 +1,62 @@
-import json
-import os
 from datetime import datetime, timedelta
-import yfinance as yf
+import numpy as np
 import pandas as pd
+from backtest_engine import to_day_array
+from investment_ledger import InvestmentLedger, make_record
+from price_store import PriceStore
 
 
 class InvestmentTracker:
-    def __init__(self, pushplus_token):
+    def __init__(self, pushplus_token, price_store=None):
         self.pushplus_token = pushplus_token
-        self.investment_file = f'investment_history_{self.pushplus_token}.json'
+        self.price_store = price_store or PriceStore()
+        self.ledger = InvestmentLedger(f'investment_history_{self.pushplus_token}')
 
     def save_investment_info(self, ticker, date, price, shares, amount):
-        history = self.load_investment_info()
-        investment_info = {
-            'date': date.strftime('%Y-%m-%d %H:%M:%S'),
-            'ticker': ticker,
-            'price': price,
-            'shares': shares,
-            'amount': amount
-        }
-        history.append(investment_info)
-        with open(self.investment_file, 'w') as f:
-            json.dump(history, f, indent=4)
+        self.ledger.append(make_record(ticker, date, price, shares, amount))
 
     def load_investment_info(self):
-        if os.path.exists(self.investment_file):
-            with open(self.investment_file, 'r') as f:
-                return json.load(f)
-        return []
+        return self.ledger.load()
+
+    def get_ticker_history(self, ticker, start_date=None, end_date=None):
+        """通过索引返回 ticker 在 [start_date, end_date] 内的投资记录"""
+        return self.ledger.query(ticker, start_date, end_date)
+
+    def get_positions(self, index, tickers=None):
+        """
+        一次返回所有标的（或 tickers 中的标的）在 index 各交易日的持仓
+
+        返回 (累计持股数, 累计投资额) 两个 DataFrame，行为 index，列为标的；
+        早于 index 的交易计入初始持仓，晚于 index 的交易不计入
+        """
+        tickers = self.ledger.tickers() if tickers is None else list(tickers)
+        days = to_day_array(index)
+        end_date = pd.Timestamp(days[-1]).date() if len(days) else None
+
+        shares = np.zeros((len(days), len(tickers)))
+        amounts = np.zeros((len(days), len(tickers)))
+        for column, ticker in enumerate(tickers):
+            history = self.ledger.query(ticker, None, end_date) if len(days) else []
+            if not history:
+                continue
+            trade_days = np.array([record['date'][:10] for record in history], dtype='datetime64[D]')
+            # 每笔交易计入不早于交易日的第一个交易日
+            positions = np.searchsorted(days, trade_days, side='left')
+            np.add.at(shares[:, column], positions, [record['shares'] for record in history])
+            np.add.at(amounts[:, column], positions, [record['amount'] for record in history])
+
+        return (pd.DataFrame(np.cumsum(shares, axis=0), index=index, columns=tickers),
+                pd.DataFrame(np.cumsum(amounts, axis=0), index=index, columns=tickers))
 
     def find_closest_date(self, ticker, price):
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=30)  # 获取最近30天的数据
-        data = yf.download(ticker, start=start_date, end=end_date)['Adj Close']
+        data = self.price_store.get_adj_close(ticker, start_date, end_date)
         closest_date = min(data.index, key=lambda x: abs(data[x] - price))
         return closest_date.to_pydatetime()
 
     def calculate_actual_returns(self, ticker):
-        history = self.load_investment_info()
-        ticker_history = [record for record in history if record['ticker'] == ticker]
+        ticker_history = self.get_ticker_history(ticker)
 
         if not ticker_history:
             return None
@@ -47,10 +65,10 @@ class InvestmentTracker:
         total_shares = sum(record['shares'] for record in ticker_history)
 
         # 获取最新价格
-        latest_data = yf.download(ticker, start=datetime.now() - timedelta(days=5), end=datetime.now())
+        latest_data = self.price_store.get_adj_close(ticker, datetime.now() - timedelta(days=5), datetime.now())
         if latest_data.empty:
             return None
-        current_price = latest_data['Adj Close'].iloc[-1]
+        current_price = latest_data.iloc[-1]
 
         current_value = total_shares * current_price
         actual_return = current_value - total_investment
@@ -58,31 +76,45 @@ class InvestmentTracker:
         return actual_return
 
     def get_actual_returns_series(self, ticker, start_date, end_date):
-        history = self.load_investment_info()
-        ticker_history = [record for record in history if record['ticker'] == ticker]
-
-        if not ticker_history:
+        returns, investments, final_values = self.get_actual_returns_frame([ticker], start_date, end_date)
+        if ticker not in investments:
             return pd.Series(), 0, 0
-
-        data = yf.download(ticker, start=start_date, end=end_date)['Adj Close']
-        returns_series = pd.Series(index=data.index, dtype=float)
-
-        cumulative_shares = 0
-        cumulative_investment = 0
-
-        for record in ticker_history:
-            date = datetime.strptime(record['date'], '%Y-%m-%d %H:%M:%S').date()
-            if date < start_date:
-                cumulative_shares += record['shares']
-                cumulative_investment += record['amount']
-            elif start_date <= date <= end_date:
-                cumulative_shares += record['shares']
-                cumulative_investment += record['amount']
-                returns_series[date:] = (data[date:] * cumulative_shares - cumulative_investment)
-
-        final_value = data.iloc[-1] * cumulative_shares if not data.empty else 0
-
-        return returns_series, cumulative_investment, final_value
+        return returns[ticker], investments[ticker], final_values[ticker]
+
+    def get_actual_returns_frame(self, tickers, start_date, end_date):
+        """
+        一次计算多个标的在 [start_date, end_date] 内的实际收益序列
+
+        持仓由交易增量按交易日累加得到，收益 = 价格 × 累计持股 − 累计投资；
+        区间内第一笔交易之前的收益为 NaN。返回 (收益 DataFrame, {ticker: 累计投资}, {ticker: 最终市值})，
+        没有投资记录的标的不包含在结果中
+        """
+        histories = {ticker: self.get_ticker_history(ticker, None, end_date) for ticker in tickers}
+        tickers = [ticker for ticker, history in histories.items() if history]
+        if not tickers:
+            return pd.DataFrame(), {}, {}
+
+        prices = self.price_store.get_prices(tickers, start_date, end_date)
+        shares, amounts = self.get_positions(prices.index, tickers)
+        returns = prices * shares - amounts
+
+        days = to_day_array(prices.index)
+        start_key = pd.Timestamp(start_date).strftime('%Y-%m-%d')
+        investments = {}
+        final_values = {}
+        for ticker in tickers:
+            history = histories[ticker]
+            in_range = [record['date'][:10] for record in history if record['date'][:10] >= start_key]
+            first_row = np.searchsorted(days, np.datetime64(in_range[0], 'D')) if in_range else len(days)
+            # 区间内第一笔交易之前没有收益数据
+            returns.iloc[:first_row, returns.columns.get_loc(ticker)] = np.nan
+
+            total_shares = sum(record['shares'] for record in history)
+            investments[ticker] = sum(record['amount'] for record in history)
+            ticker_prices = prices[ticker].dropna()
+            final_values[ticker] = ticker_prices.iloc[-1] * total_shares if not ticker_prices.empty else 0
+
+        return returns, investments, final_values
 
     def calculate_investment_metrics(self, ticker, start_date, end_date):
         returns_series, cumulative_investment, final_value = self.get_actual_returns_series(ticker, start_date,
@@ -1,60 +1,78 @@
 import argparse
 import json
+import multiprocessing
 import os
-import yfinance as yf
-import numpy as np
-import matplotlib.pyplot as plt
-import tkinter as tk
-from tkinter import ttk
-from tkinter import messagebox
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.dates as mdates
-import pandas as pd
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 import logging
-from AssetAllocationDialog import AssetAllocationDialog
+import numpy as np
+import pandas as pd
 from pushplus_sender import PushPlusSender
+from notification_queue import NotificationQueue
+from reminder_scheduler import ReminderScheduler
 from investment_tracker import InvestmentTracker
-import requests
+from investment_ledger import InvestmentLedger, make_record
+from price_store import PriceStore
+from connectivity import ConnectivityChecker
+from backtest_engine import (BacktestEngine, BacktestState, accumulate_portfolio, get_investment_positions,
+                             summarize_backtest)
+from investment_calendar import get_second_wednesday
+from indicators import TrendIndicators
+from parameter_sweep import DEFAULT_GRID, build_parameter_grid, run_parameter_sweep, sample_parameters
+import sys
 import time
 from datetime import datetime, timedelta, date, time as datetime_time
-import schedule
 
-from matplotlib import font_manager
+# run_cli 的退出码：发件箱中仍有未发送的消息（reminder_daemon.py 据此稍后重试）
+EXIT_OUTBOX_PENDING = 3
+
+# 只在 GUI 模式下使用的模块（tkinter、matplotlib），由 load_gui_modules 按需导入，CLI 模式不加载
+tk = ttk = messagebox = None
+matplotlib = None
+AssetAllocationDialog = None
+
 
-# 在文件顶部添加这个打印语句，以确认导入成功
-print("All modules imported successfully, including time module")
+def load_gui_modules():
+    global tk, ttk, messagebox, matplotlib, AssetAllocationDialog
+    if tk is not None:
+        return
+    import tkinter as tk
+    from tkinter import ttk
+    from tkinter import messagebox
+    import matplotlib
+    from AssetAllocationDialog import AssetAllocationDialog
 
 
-def test_schedule():
-    print("Schedule test function executed at", datetime.now())
+class AnalysisError(Exception):
+    """后台分析失败，由主线程以对话框（CLI 下为文本）显示 title 和 message"""
 
+    def __init__(self, title, message):
+        super().__init__(message)
+        self.title = title
+        self.message = message
 
-# 测试 schedule 的基本功能
-schedule.every(5).seconds.do(test_schedule)
+
+class AnalysisCancelled(Exception):
+    """分析请求已被更新的请求取代"""
 
 
 class InvestmentApp:
-    def __init__(self, master=None):
+    def __init__(self, master=None, token_file='pushplus_token.json', verify_login=True):
         self.master = master
-        self.token_file = 'pushplus_token.json'
+        self.token_file = token_file
+        # 自动登录时是否发送登录测试消息；定时发送提醒时不需要每次都发送
+        self.verify_login = verify_login
         self.pushplus_token = self.load_token()
         self.pushplus_sender = None
+        self.notification_queue = None
         self.investment_tracker = None
         self.is_logged_in = False
+        self.price_store = PriceStore()
+        self.backtest_checkpoint_dir = os.path.join('cache', 'backtests')
+        self.backtest_states = {}
+        self.investment_ledger = InvestmentLedger('investment_history')
         self.setup_logger()
-        self.setup_chinese_font()
-
-        # 设置matplotlib全局字体大小
-        plt.rcParams['font.size'] = 9
-        plt.rcParams['axes.titlesize'] = 10
-        plt.rcParams['axes.labelsize'] = 9
-        plt.rcParams['xtick.labelsize'] = 8
-        plt.rcParams['ytick.labelsize'] = 8
-        plt.rcParams['legend.fontsize'] = 8
-        plt.rcParams['figure.titlesize'] = 10
-        plt.rcParams['axes.unicode_minus'] = False
 
         # 配置
         self.config = {
@@ -67,7 +85,19 @@ class InvestmentApp:
             'macd_short_window': 12,
             'macd_long_window': 26,
             'macd_signal_window': 9,
+            # 网络检测结果的缓存时间（秒）
+            'connectivity_ttl': 60,
+            # 后台每批并发发送的消息数，以及获取行情和发送消息的超时时间（秒）
+            'reminder_workers': 8,
+            'reminder_timeout': 15,
+            # 'per_ticker' 为每个标的发送一条提醒，'digest' 把所有标的合并为一条 HTML 表格消息
+            'reminder_mode': 'per_ticker',
+            # 两批消息之间的最小间隔（秒），避免超出 PushPlus 的频率限制
+            'reminder_interval': 1.0,
+            # 判断定投日所使用的时区
+            'reminder_timezone': 'Asia/Shanghai',
         }
+        self.connectivity = ConnectivityChecker(ttl=self.config['connectivity_ttl'])
 
         self.portfolio_allocations = {}
 
@@ -89,11 +119,21 @@ class InvestmentApp:
         self.login_button = None
         self.input_investment_button = None
         self.reminder_button = None
+        self.chart_view = None
         self.fig = None
         self.ax1 = None
         self.ax2 = None
         self.canvas = None
         self.canvas_widget = None
+        self.progress_bar = None
+        self.status_label = None
+
+        # 后台分析：只保留最新的请求，旧请求在下一个阶段开始前取消
+        self.analysis_executor = None
+        self.analysis_request = 0
+        self.analysis_cancel = None
+        self.analysis_future = None
+        self.analysis_status = ""
 
         # 只在 GUI 模式下初始化窗口和组件
         if self.master is not None:
@@ -104,6 +144,19 @@ class InvestmentApp:
             self.auto_login()
 
     def init_gui(self):
+        load_gui_modules()
+        self.setup_chinese_font()
+
+        # 设置matplotlib全局字体大小
+        matplotlib.rcParams['font.size'] = 9
+        matplotlib.rcParams['axes.titlesize'] = 10
+        matplotlib.rcParams['axes.labelsize'] = 9
+        matplotlib.rcParams['xtick.labelsize'] = 8
+        matplotlib.rcParams['ytick.labelsize'] = 8
+        matplotlib.rcParams['legend.fontsize'] = 8
+        matplotlib.rcParams['figure.titlesize'] = 10
+        matplotlib.rcParams['axes.unicode_minus'] = False
+
         self.master.title("投资策略分析")
         self.master.geometry("1024x768")
         self.create_widgets()
@@ -111,7 +164,7 @@ class InvestmentApp:
     def auto_login(self):
         """从本地文件自动登录"""
         if not self.is_logged_in and self.pushplus_token:
-            if self.pushplus_login(self.pushplus_token):
+            if self.pushplus_login(self.pushplus_token, verify=self.verify_login):
                 print("已使用保存的 token 自动登录")
             else:
                 print("自动登录失败，请手动登录")
@@ -161,6 +214,11 @@ class InvestmentApp:
         self.update_button = ttk.Button(self.left_frame, text="更新图表", command=self.update_plot)
         self.update_button.pack(pady=10)
 
+        # 后台分析的进度
+        self.progress_bar = ttk.Progressbar(self.left_frame, mode='indeterminate', length=120)
+        self.status_label = ttk.Label(self.left_frame, text="", wraplength=140)
+        self.status_label.pack(pady=(0, 5))
+
         self.estimate_button = ttk.Button(self.left_frame, text="当天定投估值", command=self.estimate_today_investment)
         self.estimate_button.pack(pady=10)
 
@@ -190,18 +248,12 @@ class InvestmentApp:
         self.right_frame = ttk.Frame(self.master, padding="10")
         self.right_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
 
-        # 初始化图表
-        self.fig, (self.ax1, self.ax2) = plt.subplots(2, 1, figsize=(8, 7), sharex=True, gridspec_kw={'height_ratios': [2, 1]})
-        self.fig.subplots_adjust(hspace=0.1, bottom=0.12, top=0.92, left=0.12, right=0.92)
-
-        # 设置初始坐标轴
-        self.ax1.set_ylabel('累计收益 ($)')
-        self.ax2.set_ylabel('MACD')
-        self.ax2.set_xlabel('日期')
-
-        # 创建画布
-        self.canvas = FigureCanvasTkAgg(self.fig, master=self.right_frame)
-        self.canvas_widget = self.canvas.get_tk_widget()
+        # 初始化图表和画布，之后每次更新只修改图形元素的数据
+        from chart_view import ChartView
+        self.chart_view = ChartView()
+        self.fig, self.ax1, self.ax2 = self.chart_view.figure, self.chart_view.ax1, self.chart_view.ax2
+        self.canvas_widget = self.chart_view.attach(self.right_frame)
+        self.canvas = self.chart_view.canvas
         self.canvas_widget.pack(fill=tk.BOTH, expand=True)
 
     def estimate_today_investment(self):
@@ -232,6 +284,8 @@ class InvestmentApp:
 
             # 获取股票数据
             try:
+                import yfinance as yf
+
                 print(f"尝试获取 {ticker} 的数据")
                 stock = yf.Ticker(ticker)
                 
@@ -339,28 +393,8 @@ class InvestmentApp:
         return next_date + timedelta(days=7)  # 第二个周三
 
     def save_investment_info(self, ticker, date, price, shares, amount):
-        investment_file = 'investment_history.json'
-
-        # 读取现有的投资历史
-        if os.path.exists(investment_file):
-            with open(investment_file, 'r') as f:
-                history = json.load(f)
-        else:
-            history = []
-
-        # 添加新的投资信息
-        investment_info = {
-            'date': date.strftime('%Y-%m-%d %H:%M:%S'),
-            'ticker': ticker,
-            'price': float(price),  # 确保是 Python float
-            'shares': int(shares),  # 确保是 Python int
-            'amount': float(amount)  # 确保是 Python float
-        }
-        history.append(investment_info)
-
-        # 保存更新后的历史
-        with open(investment_file, 'w') as f:
-            json.dump(history, f, indent=4)
+        # 追加到投资记录，不需要读取和重写整个历史文件
+        self.investment_ledger.append(make_record(ticker, date, price, shares, amount))
 
     def show_investment_input_dialog(self):
         # if not self.investment_tracker:
@@ -400,7 +434,8 @@ class InvestmentApp:
 
         ttk.Button(dialog, text="保存", command=save_investment).grid(row=3, column=0, columnspan=2, pady=10)
 
-    def pushplus_login(self, cli_token=None):
+    def pushplus_login(self, cli_token=None, verify=True):
+        """登录 PushPlus；verify 为 False 时直接使用 token，不发送登录测试消息"""
         token = cli_token or self.pushplus_token
 
         # GUI模式下才处理退出登录
@@ -423,7 +458,13 @@ class InvestmentApp:
 
         if token:
             self.pushplus_sender = PushPlusSender(token)
-            self.investment_tracker = InvestmentTracker(token)
+            self.investment_tracker = InvestmentTracker(token, self.price_store)
+
+            if not verify:
+                self.pushplus_token = token
+                self.is_logged_in = True
+                self.start_notification_queue(token)
+                return True
 
             # 获取当前北京时间
             beijing_time = datetime.now(pytz.timezone('Asia/Shanghai'))
@@ -439,6 +480,7 @@ class InvestmentApp:
                 self.pushplus_token = token
                 self.is_logged_in = True
                 self.save_token(token)
+                self.start_notification_queue(token)
                 if self.master:
                     self.login_button.config(text="退出登录")
                     messagebox.showinfo("登录成功", f"PushPlus登录成功！\n\n测试消息发送时间：{time_str}")
@@ -454,9 +496,25 @@ class InvestmentApp:
                 return False
         return False
 
+    def start_notification_queue(self, token):
+        """启动后台发送队列，登录测试消息仍然同步发送，以便判断 token 是否有效"""
+        self.notification_queue = NotificationQueue(
+            self.pushplus_sender,
+            f'pushplus_outbox_{token}.jsonl',
+            batch_size=self.config['reminder_workers'],
+            interval=self.config['reminder_interval'],
+            timeout=self.config['reminder_timeout'],
+        )
+        self.notification_queue.start()
+
     def logout(self):
         """退出登录并清理相关状态"""
         # 清理对象状态
+        if self.notification_queue is not None:
+            self.notification_queue.stop()
+            self.notification_queue = None
+        if self.pushplus_sender is not None:
+            self.pushplus_sender.close()
         self.pushplus_sender = None
         self.pushplus_token = None
         self.is_logged_in = False
@@ -485,6 +543,15 @@ class InvestmentApp:
         """关闭程序时的清理操作"""
         if self.is_logged_in:
             self.save_token(self.pushplus_token)  # 仅在登录状态下保存token
+        if self.notification_queue is not None:
+            # 未发送的消息保留在发件箱中，下次启动时继续发送
+            self.notification_queue.stop(timeout=1)
+        if self.analysis_cancel is not None:
+            self.analysis_cancel.set()
+        if self.analysis_executor is not None:
+            self.analysis_executor.shutdown(wait=False, cancel_futures=True)
+        if self.chart_view is not None:
+            self.chart_view.close()
         self.master.destroy()
 
     def check_login(self):
@@ -523,9 +590,7 @@ class InvestmentApp:
         #     return
         ticker = self.ticker_var.get()
         try:
-            start_date = datetime.strptime(self.start_date_entry.get(), "%Y-%m").date()
-            end_date = datetime.strptime(self.end_date_entry.get(), "%Y-%m").date()
-            end_date = (date(end_date.year, end_date.month, 1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+            start_date, end_date = parse_month_range(self.start_date_entry.get(), self.end_date_entry.get())
 
             new_base_investment = float(self.base_investment_entry.get())
             if new_base_investment <= 0:
@@ -542,25 +607,64 @@ class InvestmentApp:
             messagebox.showerror("错误", "起始日期必须早于结束日期")
             return
 
-        try:
-            fig = self.analyze_and_plot(ticker, start_date, end_date)
-
-            # 清除旧的图形内容
-            for widget in self.right_frame.winfo_children():
-                widget.destroy()
+        # 取消仍在进行或排队的旧请求，只保留最新的一次
+        if self.analysis_cancel is not None:
+            self.analysis_cancel.set()
+        if self.analysis_future is not None:
+            self.analysis_future.cancel()
+        self.analysis_request += 1
+        request_id = self.analysis_request
+        cancel_event = threading.Event()
+        self.analysis_cancel = cancel_event
+
+        self.set_analysis_status("等待开始")
+        if self.analysis_executor is None:
+            self.analysis_executor = ThreadPoolExecutor(max_workers=1)
+        future = self.analysis_executor.submit(self.compute_analysis, ticker, start_date, end_date,
+                                               progress=self.set_analysis_status, cancel_event=cancel_event)
+        self.analysis_future = future
+        self.progress_bar.pack(pady=(0, 5), before=self.status_label)
+        self.progress_bar.start(10)
+        self.master.after(50, self.poll_analysis, future, request_id)
+
+    def set_analysis_status(self, message):
+        # 后台线程只修改字符串，由主线程中的 poll_analysis 更新界面
+        self.analysis_status = message
+
+    def poll_analysis(self, future, request_id):
+        if request_id != self.analysis_request:
+            # 已有更新的请求，结果直接丢弃
+            return
+        if not future.done():
+            self.status_label.config(text=self.analysis_status)
+            self.master.after(50, self.poll_analysis, future, request_id)
+            return
 
-            # 创建新的画布并显示更新后的图形
-            self.canvas = FigureCanvasTkAgg(fig, master=self.right_frame)
-            self.canvas_widget = self.canvas.get_tk_widget()
-            self.canvas_widget.pack(fill=tk.BOTH, expand=True)
-            self.canvas.draw()
+        self.progress_bar.stop()
+        self.progress_bar.pack_forget()
+        self.status_label.config(text="")
+        self.analysis_cancel = None
+        self.analysis_future = None
 
-            print("图形已更新")
+        try:
+            result = future.result()
+        except AnalysisCancelled:
+            return
+        except AnalysisError as e:
+            self.show_analysis_error(e)
+            return
         except Exception as e:
             messagebox.showerror("错误", f"分析过程中出现错误: {str(e)}")
             print(f"错误详情: {str(e)}")
             import traceback
-            traceback.print_exc()
+            traceback.print_exception(type(e), e, e.__traceback__)
+            return
+
+        if self.plot_analysis(result) is None:
+            return
+        self.chart_view.draw()
+
+        print("图形已更新")
 
     def toggle_reminder(self):
         if not self.is_logged_in:  # 保留 PushPlus 登录检查
@@ -594,12 +698,9 @@ class InvestmentApp:
         return True
 
     def run_reminder(self):
-        schedule.clear()  # 清除之前的所有任务
-        schedule.every().day.at("08:00").do(self.send_investment_reminder)
-        print("Reminder scheduled for 08:00 every day")
-        while not self.stop_flag.is_set():
-            schedule.run_pending()
-            time.sleep(60 * 1000 * 1000)  # 使用 time.sleep()
+        # 每月第二个周三 08:00 发送提醒，stop_reminder 设置 stop_flag 后立即退出
+        ReminderScheduler(self.send_investment_reminder, self.stop_flag,
+                          timezone=self.config['reminder_timezone']).run()
         print("Reminder thread stopped")
 
     def stop_reminder(self):
@@ -614,44 +715,105 @@ class InvestmentApp:
             print("定投提醒功能已停止")
 
     def send_investment_reminder(self):
-        if self.pushplus_sender is None:
+        if self.notification_queue is None:
             print("PushPlus未登录，无法发送提醒")
             return
 
-        beijing_tz = pytz.timezone('Asia/Shanghai')
-        now = datetime.now(beijing_tz)
-
-        if self.get_second_wednesday(now.date()) == now.date():
-            for ticker in self.config['tickers']:
-                try:
-                    stock = yf.Ticker(ticker)
-                    current_price = stock.info['regularMarketPrice']
-
-                    weight = self.calculate_weight(current_price)
-                    investment_amount, shares_to_buy = self.calculate_investment(current_price, weight,
-                                                                                 self.config['base_investment'])
-
-                    next_investment_date = self.get_next_investment_date(now)
-
-                    message = (
-                        f"定投提醒\n\n"
-                        f"日期时间: {now.strftime('%Y-%m-%d %H:%M:%S')} (北京时间)\n"
-                        f"股票: {ticker}\n"
-                        f"当前价格: ${current_price:.2f}\n"
-                        f"建议购买股数: {shares_to_buy}\n"
-                        f"本次投资金额: ${investment_amount:.2f}\n"
-                        f"下一次预计定投时间: {next_investment_date.strftime('%Y-%m-%d')}"
-                    )
-
-                    self.pushplus_sender.send_message(f"{ticker}定投提醒", message)
-                    print(f"已发送 {ticker} 的定投提醒")
-
-                    if self.master:
-                        messagebox.showinfo(f"{ticker}定投提醒", message)
-                except Exception as e:
-                    print(f"获取 {ticker} 数据时出错: {str(e)}")
-        else:
+        # 与调度使用同一时区判断定投日
+        now = datetime.now(pytz.timezone(self.config['reminder_timezone']))
+
+        if self.get_second_wednesday(now.date()) != now.date():
             print("今天不是定投日")
+            return
+
+        timeout = self.config['reminder_timeout']
+        # 一次批量请求获取所有标的的最新价格
+        latest_prices = self.price_store.get_latest_prices(self.config['tickers'], timeout=timeout)
+        reminders = []
+        for ticker in self.config['tickers']:
+            try:
+                if ticker not in latest_prices:
+                    raise ValueError("无法获取最新价格")
+                reminders.append(self.build_reminder(ticker, latest_prices[ticker]))
+            except Exception as e:
+                print(f"获取 {ticker} 数据时出错: {str(e)}")
+        if not reminders:
+            return
+
+        next_investment_date = self.get_next_investment_date(now)
+        if self.config['reminder_mode'] == 'digest':
+            # 所有标的合并为一条消息
+            messages = [("定投提醒", self.format_reminder_digest(reminders, now, next_investment_date))]
+        else:
+            messages = [(f"{reminder['ticker']}定投提醒",
+                         self.format_reminder_message(reminder, now, next_investment_date))
+                        for reminder in reminders]
+
+        # 消息写入发件箱后立即返回，由后台线程发送
+        for title, message in messages:
+            self.notification_queue.enqueue(title, message)
+
+        if self.master:
+            if self.config['reminder_mode'] == 'digest':
+                # 与推送一致，只弹出一个对话框
+                messagebox.showinfo("定投提醒", self.format_reminder_digest(reminders, now, next_investment_date,
+                                                                        html=False))
+            else:
+                for title, message in messages:
+                    messagebox.showinfo(title, message)
+
+    def build_reminder(self, ticker, current_price):
+        weight = self.calculate_weight(current_price)
+        investment_amount, shares_to_buy = self.calculate_investment(current_price, weight,
+                                                                     self.config['base_investment'])
+        return {
+            'ticker': ticker,
+            'price': current_price,
+            'shares': shares_to_buy,
+            'amount': investment_amount,
+        }
+
+    def format_local_time(self, now):
+        """带时区的时间，附上时区名称和 UTC 偏移，例如 2024-01-10 08:00:00 (Asia/Shanghai, UTC+08:00)"""
+        offset = now.strftime('%z')
+        return f"{now.strftime('%Y-%m-%d %H:%M:%S')} ({now.tzinfo}, UTC{offset[:3]}:{offset[3:]})"
+
+    def format_reminder_message(self, reminder, now, next_investment_date):
+        return (
+            f"定投提醒\n\n"
+            f"日期时间: {self.format_local_time(now)}\n"
+            f"股票: {reminder['ticker']}\n"
+            f"当前价格: ${reminder['price']:.2f}\n"
+            f"建议购买股数: {reminder['shares']}\n"
+            f"本次投资金额: ${reminder['amount']:.2f}\n"
+            f"下一次预计定投时间: {next_investment_date.strftime('%Y-%m-%d')}"
+        )
+
+    def format_reminder_digest(self, reminders, now, next_investment_date, html=True):
+        """把所有标的的建议渲染为一张 HTML 表格；html 为 False 时返回纯文本，用于 GUI 对话框"""
+        total = sum(reminder['amount'] for reminder in reminders)
+        if not html:
+            lines = [f"日期时间: {self.format_local_time(now)}", ""]
+            lines += [f"{reminder['ticker']}: 价格 ${reminder['price']:.2f}，建议购买 {reminder['shares']} 股，"
+                      f"金额 ${reminder['amount']:.2f}" for reminder in reminders]
+            lines += [f"合计: ${total:.2f}", "", f"下一次预计定投时间: {next_investment_date.strftime('%Y-%m-%d')}"]
+            return '\n'.join(lines)
+        rows = ''.join(
+            f"<tr><td>{reminder['ticker']}</td>"
+            f"<td align=\"right\">${reminder['price']:.2f}</td>"
+            f"<td align=\"right\">{reminder['shares']}</td>"
+            f"<td align=\"right\">${reminder['amount']:.2f}</td></tr>"
+            for reminder in reminders
+        )
+        return (
+            f"<p>日期时间: {self.format_local_time(now)}</p>"
+            f"<table border=\"1\" cellspacing=\"0\" cellpadding=\"4\">"
+            f"<tr><th>股票</th><th>当前价格</th><th>建议购买股数</th><th>本次投资金额</th></tr>"
+            f"{rows}"
+            f"<tr><td colspan=\"3\">合计</td><td align=\"right\">${total:.2f}</td></tr>"
+            f"</table>"
+            f"<p>下一次预计定投时间: {next_investment_date.strftime('%Y-%m-%d')}</p>"
+        )
 
     # 将所有之前的独立函数转换为类方法
     def calculate_macd(self, data, short_window=12, long_window=26, signal_window=9):
@@ -663,13 +825,7 @@ class InvestmentApp:
         return macd, signal, histogram
 
     def get_second_wednesday(self, date):
-        # 获取给定月份的第一天
-        first_day = date.replace(day=1)
-        # 找到第一个周三
-        first_wednesday = first_day + timedelta(days=(2 - first_day.weekday() + 7) % 7)
-        # 第二个周三
-        second_wednesday = first_wednesday + timedelta(days=7)
-        return second_wednesday
+        return get_second_wednesday(date)
 
     def get_nearest_business_day(self, date, data_index):
         while date not in data_index:
@@ -679,26 +835,12 @@ class InvestmentApp:
         return date
 
     def get_investment_dates(self, start_date, end_date, data_index):
-        investment_dates = []
-        current_date = start_date.replace(day=1)  # 从起始日期的当月开始
-
-        while current_date <= end_date:
-            # 获取当月第二周的周三
-            investment_date = self.get_second_wednesday(current_date)
-
-            # 如果投资日期在数据范围内，则添加到列表
-            if start_date <= investment_date <= end_date:
-                # 获取最近的交易日（如果当天不是交易日，则向后顺延）
-                actual_investment_date = self.get_nearest_business_day(investment_date, data_index)
-                investment_dates.append(actual_investment_date)
-
-            # 移动到下一个月
-            current_date = (current_date.replace(day=1) + timedelta(days=32)).replace(day=1)
-
-        return investment_dates
+        # 每月第二个周三，非交易日向后顺延到最近的交易日
+        positions = get_investment_positions(start_date, end_date, data_index)
+        return [data_index[i] for i in positions]
 
     def calculate_weight(self, current_price, sma=None, current_shares=0, equal_shares=0, base_investment=None,
-                         historical_data=None, total_investment=0, equal_weight_investment=0, month=1):
+                         historical_data=None, total_investment=0, equal_weight_investment=0, month=1, trend=None):
         # 使用配置中的值或提供的值
         base_investment = float(base_investment or self.config['base_investment'])
 
@@ -718,12 +860,15 @@ class InvestmentApp:
         else:
             weight = 1.0
 
-        # 如果没有提供历史数据，我们就不进行市场趋势调整
-        if historical_data is not None:
+        # 如果没有提供历史数据或趋势指标，我们就不进行市场趋势调整
+        if trend is None and historical_data is not None:
+            # 只用最近的价格建立流式指标，不必对完整历史重复计算
+            trend = TrendIndicators.from_history(historical_data)
+        if trend is not None:
             # 计算市场趋势指标
-            sma_50 = historical_data.rolling(window=50).mean().iloc[-1]
-            sma_200 = historical_data.rolling(window=200).mean().iloc[-1]
-            rsi = self.calculate_rsi(historical_data).iloc[-1]
+            sma_50 = trend.sma_50.value
+            sma_200 = trend.sma_200.value
+            rsi = trend.rsi.value
 
             # 根据市场趋势调整权重
             if current_price < sma_50 and current_price < sma_200:  # 强烈下跌趋势
@@ -748,8 +893,7 @@ class InvestmentApp:
                 weight += 0.3  # 增加投资
 
         # 考虑兑现部分收益
-        if shares_difference > 0.2 and historical_data is not None and self.calculate_rsi(historical_data).iloc[
-            -1] > 70:  # 如果持股显著多于等权且RSI高
+        if shares_difference > 0.2 and trend is not None and trend.rsi.value > 70:  # 如果持股显著多于等权且RSI高
             sell_proportion = min(shares_difference - 0.1, 0.1)  # 最多卖出到比等权多10%
             return -sell_proportion  # 返回负值表示卖出
 
@@ -887,102 +1031,59 @@ class InvestmentApp:
         self.logger.info(f"开始创建投资组合数据 - 起始日期: {start_date}, 结束日期: {end_date}")
         self.logger.info(f"投资组合配置: {self.portfolio_allocations}")
 
-        portfolio_data = pd.DataFrame(index=data.index)
-        portfolio_data['Portfolio_Value'] = 0.0
-        portfolio_data['Portfolio_Cost'] = 0.0
-
-        # 新增：创建一个 DataFrame 来存储每个投资日期的详细信息
-        investment_details = []
-
-        for ticker in self.portfolio_allocations.keys():
-            portfolio_data[f'{ticker}_Shares'] = 0.0
-            portfolio_data[f'{ticker}_Cost'] = 0.0
+        # 一次批量请求获取组合中所有缺少的标的，并按 data 的日期对齐
+        missing_tickers = [ticker for ticker, weight in self.portfolio_allocations.items()
+                           if weight != 0 and ticker not in data.columns]
+        if missing_tickers:
+            self.logger.info(f"批量获取 {missing_tickers} 的数据")
+            prices = self.price_store.get_prices(missing_tickers, start_date, end_date)
+            prices = prices.reindex(pd.DatetimeIndex(data.index))
+            for ticker in missing_tickers:
+                if prices[ticker].isna().all():
+                    self.logger.warning(f"无法获取 {ticker} 的数据，跳过此标的")
+                    continue
+                data[ticker] = prices[ticker].to_numpy()
 
         investment_dates = self.get_investment_dates(start_date, end_date, data.index)
         self.logger.info(f"投资日期: {investment_dates}")
 
-        cumulative_investment = 0.0
-
-        for date in investment_dates:
-            self.logger.info(f"\n--- 投资日期: {date} ---")
-            total_investment = 0.0
-            date_details = {'日期': date, '总投资金额': 0.0, '累计投资成本': 0.0}
-            for ticker, weight in self.portfolio_allocations.items():
-                if weight == 0:
-                    continue
-                if ticker not in data.columns:
-                    try:
-                        self.logger.info(f"下载 {ticker} 的数据")
-                        # 获取历史数据
-                        ticker_data_full = yf.download(ticker, start=start_date, end=end_date)
-                        
-                        # 检查数据是否为空
-                        if ticker_data_full.empty:
-                            self.logger.warning(f"无法获取 {ticker} 的数据，跳过此标的")
-                            continue
-                            
-                        # 检查是否包含 'Adj Close' 列
-                        if 'Adj Close' not in ticker_data_full.columns:
-                            self.logger.warning(f"下载的 {ticker} 数据不包含 'Adj Close' 列。尝试使用 'Close' 列。")
-                            # 尝试使用 'Close' 列作为替代
-                            if 'Close' in ticker_data_full.columns:
-                                ticker_data = ticker_data_full['Close']
-                            else:
-                                self.logger.error(f"获取的 {ticker} 数据格式异常，缺少价格信息。跳过此标的。")
-                                continue
-                        else:
-                            ticker_data = ticker_data_full['Adj Close']
-                            
-                        data[ticker] = ticker_data
-                        
-                    except Exception as e:
-                        self.logger.error(f"获取 {ticker} 数据时出错: {str(e)}。跳过此标的。")
-                        continue
-
-                # 检查特定日期是否有数据
-                if date not in data.index or pd.isna(data.loc[date, ticker]):
-                    self.logger.warning(f"{date} 没有 {ticker} 的数据，跳过此标的")
-                    continue
-
-                price = data.loc[date, ticker]
-                allocation = self.config['base_investment'] * weight
-                shares = np.ceil(allocation / price)
-                actual_investment = shares * price
-                total_investment += actual_investment
-
-                portfolio_data.loc[date:, f'{ticker}_Shares'] += shares
-                portfolio_data.loc[date:, f'{ticker}_Cost'] += actual_investment
+        tickers = [ticker for ticker, weight in self.portfolio_allocations.items()
+                   if weight != 0 and ticker in data.columns]
+        positions = data.index.get_indexer(investment_dates)
 
-                self.logger.info(f"标的: {ticker}")
-                self.logger.info(f"  价格: ${price:.2f}")
-                self.logger.info(f"  分配金额: ${allocation:.2f}")
-                self.logger.info(f"  购买股数: {shares}")
-                self.logger.info(f"  实际投资金额: ${actual_investment:.2f}")
+        # 在 (交易日, 标的) 矩阵上一次性计算所有买入、持仓和市值
+        result = accumulate_portfolio(data[tickers].to_numpy(dtype=float), positions,
+                                      [self.portfolio_allocations[ticker] for ticker in tickers],
+                                      self.config['base_investment'])
 
-                date_details[f'{ticker}_价格'] = price
-                date_details[f'{ticker}_分配金额'] = allocation
-                date_details[f'{ticker}_购买股数'] = shares
-                date_details[f'{ticker}_实际投资金额'] = actual_investment
+        columns = {'Portfolio_Value': result['value'], 'Portfolio_Cost': result['total_cost']}
+        for ticker in self.portfolio_allocations.keys():
+            if ticker in tickers:
+                column = tickers.index(ticker)
+                columns[f'{ticker}_Shares'] = result['shares'][:, column]
+                columns[f'{ticker}_Cost'] = result['cost'][:, column]
+            else:
+                columns[f'{ticker}_Shares'] = 0.0
+                columns[f'{ticker}_Cost'] = 0.0
+        portfolio_data = pd.DataFrame(columns, index=data.index)
 
+        # 每个投资日的详细信息
+        investment_details = []
+        cumulative_investment = 0.0
+        for row, date in enumerate(investment_dates):
+            total_investment = float(result['purchase_cost'][row].sum())
             cumulative_investment += total_investment
-            portfolio_data.loc[date:, 'Portfolio_Cost'] = cumulative_investment
-            self.logger.info(f"本期总投资金额: ${total_investment:.2f}")
-            self.logger.info(f"累计投资成本: ${cumulative_investment:.2f}")
-
-            date_details['总投资金额'] = total_investment
-            date_details['累计投资成本'] = cumulative_investment
-            investment_details.append(date_details)
-
-        self.logger.info("\n--- 投资组合累计数据 ---")
-        for date in data.index:
-            portfolio_value = 0.0
-            for ticker, weight in self.portfolio_allocations.items():
-                if weight == 0:
+            date_details = {'日期': date, '总投资金额': total_investment, '累计投资成本': cumulative_investment}
+            for column, ticker in enumerate(tickers):
+                if not result['purchased'][row, column]:
+                    self.logger.warning(f"{date} 没有 {ticker} 的数据，跳过此标的")
                     continue
-                shares = portfolio_data.loc[date, f'{ticker}_Shares']
-                price = data.loc[date, ticker]
-                portfolio_value += shares * price
-            portfolio_data.loc[date, 'Portfolio_Value'] = portfolio_value
+                date_details[f'{ticker}_价格'] = result['purchase_prices'][row, column]
+                date_details[f'{ticker}_分配金额'] = self.config['base_investment'] * self.portfolio_allocations[ticker]
+                date_details[f'{ticker}_购买股数'] = result['purchase_shares'][row, column]
+                date_details[f'{ticker}_实际投资金额'] = result['purchase_cost'][row, column]
+            self.logger.debug(f"投资日期: {date}, 明细: {date_details}")
+            investment_details.append(date_details)
 
         portfolio_data['Portfolio_Return'] = portfolio_data['Portfolio_Value'] - portfolio_data['Portfolio_Cost']
         portfolio_data['Total_Return_Rate'] = portfolio_data['Portfolio_Return'] / portfolio_data['Portfolio_Cost']
@@ -997,42 +1098,6 @@ class InvestmentApp:
 
         return portfolio_data
 
-    def add_endpoint_annotations(self, ax, equal_returns, weighted_returns, equal_column_name, portfolio_returns=None):
-        """
-        添加终点注释
-        """
-        try:
-            # 只在最后一个点添加注释，使用更小的字体和更紧凑的格式
-            
-            # 加权收益终点注释
-            if 'weighted_cumulative_return' in weighted_returns.columns:
-                weighted_value = weighted_returns['weighted_cumulative_return'].iloc[-1]
-                ax.scatter(weighted_returns.index[-1], weighted_value, color='blue', s=20)
-                ax.annotate(f'{weighted_value:.0f}',
-                            (weighted_returns.index[-1], weighted_value),
-                            textcoords="offset points", xytext=(0, 5), ha='center', fontsize=7)
-
-            # 等权收益终点注释
-            if 'equal_cumulative_return' in equal_returns.columns:
-                equal_value = equal_returns['equal_cumulative_return'].iloc[-1]
-                ax.scatter(equal_returns.index[-1], equal_value, color='orange', s=20)
-                ax.annotate(f'{equal_value:.0f}',
-                            (equal_returns.index[-1], equal_value),
-                            textcoords="offset points", xytext=(0, 5), ha='center', fontsize=7)
-
-            # 投资组合收益终点注释
-            if portfolio_returns is not None and len(portfolio_returns) > 0:
-                portfolio_value = portfolio_returns.iloc[-1]
-                ax.scatter(portfolio_returns.index[-1], portfolio_value, color='green', s=20)
-                ax.annotate(f'{portfolio_value:.0f}',
-                            (portfolio_returns.index[-1], portfolio_value),
-                            textcoords="offset points", xytext=(0, 5), ha='center', fontsize=7)
-
-        except Exception as e:
-            print(f"添加终点注释时出现错误: {str(e)}")
-            # 继续执行而不中断程序
-            pass
-
     def create_summary_statistics(self, ticker, equal_investment, weighted_investment,
                                   equal_portfolio_values, weighted_portfolio_values,
                                   equal_cumulative_returns, weighted_cumulative_returns,
@@ -1111,29 +1176,121 @@ class InvestmentApp:
 
         return summary
 
+    def run_incremental_backtest(self, ticker, prices, start_date, end_date):
+        """
+        使用上一次回测保存的状态，只对新增的交易日执行回测
+
+        状态按 (ticker, start_date) 保存在内存和 cache/backtests 目录中，参数变化或结束日期提前时重新完整回测
+        """
+        engine = BacktestEngine.from_config(self.config)
+        key = (ticker, start_date)
+        path = os.path.join(self.backtest_checkpoint_dir, f"{ticker}_{start_date.strftime('%Y%m%d')}.pkl")
+
+        state = self.backtest_states.get(key) or BacktestState.load(path)
+        if state is not None:
+            result = engine.resume(state, prices, end_date)
+        else:
+            result = engine.run_with_state(prices, start_date, end_date)
+        if result is None:
+            return None
+
+        daily_data, state = result
+        self.backtest_states[key] = state
+        try:
+            state.save(path)
+        except OSError as e:
+            print(f"保存回测状态失败: {str(e)}")
+        return daily_data
+
+    def run_parameter_sweep(self, ticker, start_date, end_date, samples=None, max_workers=None):
+        """
+        在多进程中扫描加权定投的参数组合，并将排序后的结果保存到 output 目录
+        """
+        prices = self.price_store.get_adj_close(ticker, start_date, end_date)
+        if prices.empty:
+            print(f"无法获取 {ticker} 的数据")
+            return None
+
+        if samples:
+            parameters = sample_parameters(samples=samples)
+        else:
+            parameters = build_parameter_grid()
+        print(f"开始扫描 {ticker} 的 {len(parameters)} 组参数")
+
+        started = time.time()
+        table = run_parameter_sweep(prices, start_date, end_date, self.config['base_investment'], parameters,
+                                    max_workers=max_workers)
+        print(f"参数扫描完成，用时 {time.time() - started:.1f} 秒")
+        if table.empty:
+            print("选定的日期范围内没有可用的投资日期（每月第二个周三）")
+            return table
+
+        output_dir = 'output'
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        filename = os.path.join(output_dir,
+                                f"{ticker}_参数扫描_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.csv")
+        table.to_csv(filename, encoding='utf-8-sig')
+
+        columns = list(DEFAULT_GRID) + ['weighted_total_return', 'weighted_annual_return']
+        print(table[columns].head(10).to_string(float_format=lambda x: f"{x:.2f}"))
+        print(f"扫描结果已保存到文件: {filename}")
+        return table
+
+    def run_batch_backtest(self, tickers, start_date, end_date, save_excel=False, max_workers=None):
+        """
+        对多个标的并行执行等额/加权定投回测，返回合并后的摘要统计表
+
+        所有标的的价格通过一次批量请求加载，可选地把摘要和每个标的的投资明细保存到一个 Excel 文件
+        """
+        prices = self.price_store.get_prices(tickers, start_date, end_date)
+        engine = BacktestEngine.from_config(self.config)
+
+        def backtest(ticker):
+            series = prices[ticker].dropna()
+            if series.empty:
+                print(f"无法获取 {ticker} 的数据，跳过此标的")
+                return ticker, None
+            series.index = series.index.date
+            return ticker, engine.run(series, start_date, end_date)
+
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=max_workers or min(len(tickers), os.cpu_count() or 1)) as executor:
+            results = dict(executor.map(backtest, tickers))
+
+        rows = []
+        for ticker in tickers:
+            daily_data = results.get(ticker)
+            if daily_data is None:
+                continue
+            rows.append({'ticker': ticker, **summarize_backtest(daily_data, start_date, end_date)})
+        summary = pd.DataFrame(rows)
+        print(f"批量回测完成，共 {len(rows)} 个标的，用时 {time.time() - started:.2f} 秒")
+        if summary.empty:
+            return summary
+        summary = summary.set_index('ticker')
+        print(summary.to_string(float_format=lambda x: f"{x:.2f}"))
+
+        if save_excel:
+            output_dir = 'output'
+            if not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+            filename = os.path.join(output_dir,
+                                    f"批量回测_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.xlsx")
+            with pd.ExcelWriter(filename) as writer:
+                summary.to_excel(writer, sheet_name='摘要')
+                for ticker in summary.index:
+                    daily_data = results[ticker]
+                    investment_days = daily_data[daily_data['equal_investment'] > 0]
+                    investment_days.to_excel(writer, sheet_name=ticker, index_label='date')
+            print(f"数据已保存到文件: {filename}")
+
+        return summary
+
     def check_internet_connection(self):
+        """并发探测行情数据服务器，结果在 config['connectivity_ttl'] 秒内复用"""
         try:
-            # 尝试连接多个网站，只要有一个能连接成功就返回True
-            websites = [
-                "https://www.baidu.com",  # 中国用户通常可以访问的网站
-                "https://www.qq.com",
-                "https://www.bing.com",
-                "https://www.sina.com.cn",
-                "https://finance.yahoo.com"  # 原有的网站，但放在最后尝试
-            ]
-            
-            for website in websites:
-                try:
-                    response = requests.get(website, timeout=3)
-                    if response.status_code == 200:
-                        print(f"成功连接到 {website}")
-                        return True
-                except:
-                    continue
-                    
-            # 所有网站都连接失败
-            print("无法连接到任何测试网站")
-            return False
+            return self.connectivity.is_online()
         except Exception as e:
             print(f"网络连接检测发生错误: {str(e)}")
             return False
@@ -1141,22 +1298,40 @@ class InvestmentApp:
     def analyze_and_plot(self, ticker, start_date, end_date):
         # if not self.check_login():
         #     return None
-
-        # 检查网络连接
-        if not self.check_internet_connection():
-            messagebox.showerror("网络错误", "无法连接到数据服务器。这可能是因为：\n1. 网络连接异常\n2. 防火墙或网络设置限制了连接\n3. 数据服务器暂时不可用\n\n请检查网络连接或稍后再试。如果问题持续存在，可尝试使用VPN。")
+        try:
+            result = self.compute_analysis(ticker, start_date, end_date)
+        except AnalysisError as e:
+            self.show_analysis_error(e)
             return None
+        return self.plot_analysis(result)
+
+    def compute_analysis(self, ticker, start_date, end_date, progress=None, cancel_event=None):
+        """
+        获取数据并完成回测，返回绘图所需的数据；不调用 Tk 或 pyplot，可以在后台线程中运行
+
+        出错时抛出 AnalysisError；cancel_event 被设置后在下一个阶段开始前抛出 AnalysisCancelled
+        """
+        def step(message):
+            if cancel_event is not None and cancel_event.is_set():
+                raise AnalysisCancelled()
+            if progress is not None:
+                progress(message)
+
+        step("检查网络连接")
+        # 本地缓存已覆盖所需区间时无需检查网络连接
+        if not self.price_store.is_cached([ticker], start_date, end_date) and not self.check_internet_connection():
+            raise AnalysisError("网络错误", "无法连接到数据服务器。这可能是因为：\n1. 网络连接异常\n2. 防火墙或网络设置限制了连接\n3. 数据服务器暂时不可用\n\n请检查网络连接或稍后再试。如果问题持续存在，可尝试使用VPN。")
 
         try:
-            # 下载数据
-            print(f"开始下载 {ticker} 的数据，从 {start_date} 到 {end_date}")
-            data = yf.download(ticker, start=start_date, end=end_date)
-            
+            # 获取数据（优先使用本地缓存，只下载缺失的区间）
+            step(f"获取 {ticker} 的数据")
+            print(f"开始获取 {ticker} 的数据，从 {start_date} 到 {end_date}")
+            data = self.price_store.get_history(ticker, start_date, end_date)
+
             # 检查数据是否为空
             if data.empty:
-                messagebox.showerror("数据错误", f"无法获取 {ticker} 的数据。可能是因为：\n1. 股票代码不存在\n2. 所选时间范围内没有数据\n3. Yahoo Finance 服务暂时不可用")
-                return None
-                
+                raise AnalysisError("数据错误", f"无法获取 {ticker} 的数据。可能是因为：\n1. 股票代码不存在\n2. 所选时间范围内没有数据\n3. Yahoo Finance 服务暂时不可用")
+
             # 检查是否包含 'Adj Close' 列
             if 'Adj Close' not in data.columns:
                 print(f"警告: 下载的数据不包含 'Adj Close' 列。可用列: {data.columns.tolist()}")
@@ -1165,22 +1340,23 @@ class InvestmentApp:
                     print("使用 'Close' 列代替 'Adj Close'")
                     adj_close = data['Close']
                 else:
-                    messagebox.showerror("数据错误", f"获取的 {ticker} 数据格式异常，缺少价格信息。请稍后再试。")
-                    return None
+                    raise AnalysisError("数据错误", f"获取的 {ticker} 数据格式异常，缺少价格信息。请稍后再试。")
             else:
                 adj_close = data['Adj Close']
-                
+
             # 确保数据是浮点数类型
             adj_close = adj_close.astype(float)
-            
+
+        except (AnalysisError, AnalysisCancelled):
+            raise
         except Exception as e:
             error_message = f"获取数据过程中出现错误: {str(e)}"
             print(error_message)
-            messagebox.showerror("数据错误", f"获取 {ticker} 数据时出错: {str(e)}\n\n这可能是因为网络问题或Yahoo Finance服务暂时不可用。请稍后再试。")
-            return None
+            raise AnalysisError("数据错误", f"获取 {ticker} 数据时出错: {str(e)}\n\n这可能是因为网络问题或Yahoo Finance服务暂时不可用。请稍后再试。")
 
         try:
             # 计算技术指标
+            step("计算技术指标")
             data = pd.DataFrame(adj_close)
             data.columns = [ticker]
             data[f'{ticker}_SMA50'] = data[ticker].rolling(window=50).mean()
@@ -1202,134 +1378,19 @@ class InvestmentApp:
             investment_dates = self.get_investment_dates(start_date, end_date, data.index)
 
             if not investment_dates:
-                messagebox.showerror("日期错误", "选定的日期范围内没有可用的投资日期（每月第二个周三）")
-                return None
-
-            # 初始化每日数据DataFrame
-            base_investment = self.config['base_investment']
-            daily_data = pd.DataFrame(index=data.index)
-            daily_data['price'] = data[ticker]
-
-            # 初始化持仓和投资数据
-            daily_data['equal_shares'] = 0.0
-            daily_data['weighted_shares'] = 0.0
-            daily_data['equal_investment'] = 0.0
-            daily_data['weighted_investment'] = 0.0
-            daily_data['equal_cumulative_shares'] = 0.0
-            daily_data['weighted_cumulative_shares'] = 0.0
-            daily_data['equal_cumulative_investment'] = 0.0
-            daily_data['weighted_cumulative_investment'] = 0.0
-
-            # 计算每个投资日的投资情况
-            for d in investment_dates:
-                price = data.loc[d, ticker]
-
-                # 等额定投策略
-                equal_invest_amount = base_investment
-                equal_shares = equal_invest_amount / price
-
-                # 加权定投策略
-                weight = self.calculate_weight(price,
-                                               data[ticker].rolling(window=self.config['sma_window']).mean().loc[d],
-                                               data[ticker].rolling(window=self.config['std_window']).std().loc[d],
-                                               data[ticker].rolling(
-                                                   window=self.config['std_window']).std().expanding().mean().loc[d])
-                weighted_invest_amount = base_investment * weight
-                weighted_shares = weighted_invest_amount / price
-
-                # 记录投资日的数据
-                daily_data.loc[d, 'equal_shares'] = equal_shares
-                daily_data.loc[d, 'weighted_shares'] = weighted_shares
-                daily_data.loc[d, 'equal_investment'] = equal_invest_amount
-                daily_data.loc[d, 'weighted_investment'] = weighted_invest_amount
-
-            # 计算累计持股数
-            daily_data['equal_cumulative_shares'] = daily_data['equal_shares'].cumsum()
-            daily_data['weighted_cumulative_shares'] = daily_data['weighted_shares'].cumsum()
-
-            # 计算累计投资额
-            daily_data['equal_cumulative_investment'] = daily_data['equal_investment'].cumsum()
-            daily_data['weighted_cumulative_investment'] = daily_data['weighted_investment'].cumsum()
-
-            # 计算每日市值
-            daily_data['equal_market_value'] = daily_data['equal_cumulative_shares'] * daily_data['price']
-            daily_data['weighted_market_value'] = daily_data['weighted_cumulative_shares'] * daily_data['price']
-
-            # 计算每日累计收益
-            daily_data['equal_cumulative_return'] = daily_data['equal_market_value'] - daily_data[
-                'equal_cumulative_investment']
-            daily_data['weighted_cumulative_return'] = daily_data['weighted_market_value'] - daily_data[
-                'weighted_cumulative_investment']
-
-            # 绘图
-            fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(8, 7), sharex=True, gridspec_kw={'height_ratios': [2, 1]})
-            fig.subplots_adjust(hspace=0.1, bottom=0.12, top=0.92, left=0.12, right=0.92)
-
-            # 绘制每日累计收益
-            ax1.plot(daily_data.index, daily_data['equal_cumulative_return'],
-                     label=f'等权', color='orange')
-            ax1.plot(daily_data.index, daily_data['weighted_cumulative_return'],
-                     label=f'加权', color='blue')
+                raise AnalysisError("日期错误", "选定的日期范围内没有可用的投资日期（每月第二个周三）")
+
+            # 回测：指标只计算一次，所有投资日的权重一次性求出；结束日期后移时只处理新增的交易日
+            step("回测")
+            daily_data = self.run_incremental_backtest(ticker, data[ticker], start_date, end_date)
 
             portfolio_returns = None
             if self.portfolio_allocations:
+                step("计算资产组合")
                 portfolio_data = self.create_portfolio_data(data, start_date, end_date)
                 portfolio_returns = portfolio_data['Portfolio_Return']
                 # 将整个 portfolio_data 附加到 portfolio_returns
                 portfolio_returns.portfolio_data = portfolio_data
-                ax1.plot(portfolio_data.index, portfolio_returns, label='组合', color='green')
-
-            # 设置图表属性
-            ax1.set_title(f'{ticker}累计收益({start_date.year}-{end_date.year})', fontsize=9)
-            ax1.set_ylabel('收益($)', fontsize=8)
-            ax1.legend(fontsize=7, loc='upper left', framealpha=0.7)
-            ax1.grid(True, alpha=0.3)
-            
-            # 设置刻度标签字体大小
-            ax1.tick_params(axis='both', which='major', labelsize=7)
-            ax1.tick_params(axis='both', which='minor', labelsize=6)
-
-            # 添加零线
-            ax1.axhline(y=0, color='red', linestyle=':', linewidth=0.8)
-
-            # 确保y轴范围包含所有数据点
-            y_values = [daily_data['equal_cumulative_return'], daily_data['weighted_cumulative_return']]
-            if portfolio_returns is not None:
-                y_values.append(portfolio_returns)
-            y_min = min(min(y) for y in y_values)
-            y_max = max(max(y) for y in y_values)
-            y_range = y_max - y_min
-            ax1.set_ylim(y_min - 0.1 * y_range, y_max + 0.1 * y_range)
-
-            # 添加终点注释部分的更新
-            self.add_endpoint_annotations(
-                ax1,
-                daily_data[['equal_cumulative_return']],
-                daily_data[['weighted_cumulative_return']],
-                'equal_cumulative_return',
-                portfolio_returns
-            )
-
-            # 绘制MACD（其余部分保持不变）
-            ax2.plot(data.index, data[f'{ticker}_MACD'], label='MACD', color='blue')
-            ax2.plot(data.index, data[f'{ticker}_MACD_SIGNAL'], label='Signal', color='red')
-            ax2.bar(data.index, data[f'{ticker}_MACD'] - data[f'{ticker}_MACD_SIGNAL'],
-                    label='Hist', color='gray', alpha=0.5)
-            ax2.axhline(y=0, color='black', linestyle='--', linewidth=0.5)
-            ax2.set_ylabel('MACD', fontsize=8)
-            ax2.legend(loc='upper left', fontsize=6)
-            ax2.grid(True, alpha=0.3)
-            
-            # 设置x轴属性
-            ax2.set_xlabel('日期', fontsize=8)
-            years = mdates.YearLocator(2)  # 每2年标记一次
-            months = mdates.MonthLocator(interval=4)  # 每4个月标记一次
-            years_fmt = mdates.DateFormatter('%Y')
-            ax2.xaxis.set_major_locator(years)
-            ax2.xaxis.set_major_formatter(years_fmt)
-            ax2.xaxis.set_minor_locator(months)
-            plt.setp(ax2.xaxis.get_majorticklabels(), rotation=45, ha='right', fontsize=6)
-            ax2.set_xlim(data.index[0], data.index[-1])
 
             # 更新统计信息
             summary = self.create_summary_statistics(
@@ -1344,76 +1405,65 @@ class InvestmentApp:
                 end_date,
                 portfolio_returns
             )
+            step("绘图")
+
+        except (AnalysisError, AnalysisCancelled):
+            raise
+        except Exception as e:
+            error_message = f"分析过程中出现错误: {str(e)}"
+            print(error_message)
+            raise AnalysisError("分析错误", f"分析过程中出现错误: {str(e)}\n\n这可能是因为网络问题或Yahoo Finance服务暂时不可用。请稍后再试。")
 
-            # 使用更小的字体显示摘要信息，并调整位置到图表左侧
-            ax1.text(0.02, 0.98, summary, transform=ax1.transAxes, 
-                     verticalalignment='top', horizontalalignment='left',
-                     bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5), 
-                     fontsize=5.5, linespacing=0.95)
-            
-            # 确保图表不会超出边界
-            plt.tight_layout(pad=0.5)
+        return {
+            'ticker': ticker,
+            'start_date': start_date,
+            'end_date': end_date,
+            'data': data,
+            'daily_data': daily_data,
+            'portfolio_returns': portfolio_returns,
+            'summary': summary,
+        }
+
+    def show_analysis_error(self, error):
+        if self.master:
+            messagebox.showerror(error.title, error.message)
+        else:
+            print(f"{error.title}: {error.message}")
 
-            return fig
+    def plot_analysis(self, result):
+        """把 compute_analysis 的结果更新到图表上并返回 Figure，需要在主线程中调用"""
+        try:
+            if self.chart_view is None:
+                # 没有界面时（例如直接调用 analyze_and_plot）也复用同一个图表
+                from chart_view import ChartView
+                self.chart_view = ChartView()
+            self.chart_view.update(**result)
+            return self.chart_view.figure
 
         except Exception as e:
-            error_message = f"分析过程中出现错误: {str(e)}"
+            error_message = f"绘图过程中出现错误: {str(e)}"
             print(error_message)
-            messagebox.showerror("分析错误", f"分析过程中出现错误: {str(e)}\n\n这可能是因为网络问题或Yahoo Finance服务暂时不可用。请稍后再试。")
+            self.show_analysis_error(AnalysisError("分析错误", error_message))
             return None
 
-    
     def setup_chinese_font(self):
         """
             根据操作系统设置合适的中文字体
         """
         import platform
+        from font_resolver import FontResolver, get_font_candidates
         system = platform.system()
 
-        # 根据操作系统选择字体
-        if system == 'Windows':
-            font = 'Microsoft YaHei'
-            fonts = [font]
-        elif system == 'Darwin':  # MacOS
-
-            
-            # 取消这段注释，可以打印出系统字体名称列表
-            #debug_to_display_system_fonts = """
-            print(f"---- 系统字体列表: ----- ")
-            for font_path in font_manager.findSystemFonts(fontpaths=None, fontext='ttf'):
-                try:
-                    font_prop = font_manager.FontProperties(fname=font_path)
-                    font_name = font_prop.get_name()
-                    print(f"font_path: {font_path}, font_name: {font_name}")
-                except RuntimeError:
-                    print(f"无法加载字体: {font_path}")
-                    #"""
-                
-            # Mac系统字体优先级
-            fonts = [
-                'PingFang HK',
-                'PingFang SC',
-                'Hiragino Sans GB',
-                'STHeiti',
-                'Heiti SC',
-                'STSong',
-                'Songti SC'
-            ]
-            # 选择第一个可用的字体
-            #font = next((f for f in mac_fonts), 'Arial Unicode MS')
-        elif system == 'Linux':
-            font = 'WenQuanYi Micro Hei'
-            fonts = [font]
-        else:
-            font = 'Arial Unicode MS'
-            fonts = [font]
+        # 选择结果按系统字体集合缓存，字体没有变化时不再扫描字体文件
+        font = FontResolver().resolve()
+        fonts = [font] if font else get_font_candidates(system)
 
         # 设置matplotlib字体
-        plt.rcParams['font.sans-serif'] = fonts
-        plt.rcParams['axes.unicode_minus'] = False  # 用来正常显示负号
+        matplotlib.rcParams['font.sans-serif'] = fonts
+        matplotlib.rcParams['axes.unicode_minus'] = False  # 用来正常显示负号
 
         print(f"当前操作系统: {system}")
-        #print(f"使用字体: {font}")
+        print(f"使用字体: {font or '未找到可用的中文字体'}")
 
 
 def parse_arguments():
@@ -1422,10 +1472,42 @@ def parse_arguments():
     parser.add_argument("--login", help="Login to PushPlus with token", metavar="TOKEN")
     parser.add_argument("--estimate", action="store_true", help="Estimate today's investment")
     parser.add_argument("--start-reminder", action="store_true", help="Start investment reminder")
+    parser.add_argument("--send-reminder", action="store_true",
+                        help="Send today's investment reminder once (used by reminder_daemon.py)")
+    parser.add_argument("--flush-outbox", action="store_true",
+                        help="Send messages left in the PushPlus outbox and exit (used by reminder_daemon.py)")
+    parser.add_argument("--token-file", default="pushplus_token.json", help="PushPlus token file")
+    parser.add_argument("--timezone", help="Timezone used to decide whether today is an investment day "
+                                           "(default: Asia/Shanghai)")
+    parser.add_argument("--reminder-mode", choices=["per_ticker", "digest"],
+                        help="Send one reminder per ticker or a single digest table")
+    parser.add_argument("--sweep", action="store_true", help="Run a parameter sweep of the weighted strategy")
+    parser.add_argument("--ticker", help="Ticker used by --sweep (default: first configured ticker)")
+    parser.add_argument("--start", default="2010-01", help="Backtest start month for --sweep/--batch (YYYY-MM)")
+    parser.add_argument("--end", default=datetime.now().strftime("%Y-%m"), help="Backtest end month (YYYY-MM)")
+    parser.add_argument("--batch", nargs="*", metavar="TICKER",
+                        help="Backtest every configured ticker (or the given tickers) and print a combined summary")
+    parser.add_argument("--excel", action="store_true", help="Also save the --batch results to an Excel workbook")
+    parser.add_argument("--samples", type=int, help="Randomly sample N parameter combinations instead of the full grid")
+    parser.add_argument("--workers", type=int,
+                        help="Number of workers: processes for --sweep (default: CPU count), "
+                             "threads for --batch (default: min(tickers, CPU count))")
     return parser.parse_args()
 
 
+def parse_month_range(start_text, end_text):
+    """把 YYYY-MM 格式的起止月份转换为起始月第一天和结束月最后一天"""
+    start_date = datetime.strptime(start_text, "%Y-%m").date()
+    end_date = datetime.strptime(end_text, "%Y-%m").date()
+    end_date = (date(end_date.year, end_date.month, 1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return start_date, end_date
+
+
 def run_cli(app, args):
+    """执行命令行操作；退出时发件箱中仍有未发送的消息则返回 EXIT_OUTBOX_PENDING"""
+    if args.timezone:
+        app.config['reminder_timezone'] = args.timezone
+
     if args.login:
         if app.pushplus_login(args.login):
             print("PushPlus登录成功")
@@ -1443,6 +1525,15 @@ def run_cli(app, args):
         else:
             print("错误: 请先登录PushPlus")
 
+    if args.reminder_mode:
+        app.config['reminder_mode'] = args.reminder_mode
+
+    if args.send_reminder:
+        if app.is_logged_in:
+            app.send_investment_reminder()
+        else:
+            print("错误: 请先登录PushPlus")
+
     if args.start_reminder:
         if app.is_logged_in:
             result = app.start_reminder()
@@ -1456,25 +1547,45 @@ def run_cli(app, args):
         else:
             print("错误: 请先登录PushPlus")
 
+    if args.sweep or args.batch is not None:
+        try:
+            start_date, end_date = parse_month_range(args.start, args.end)
+        except ValueError as e:
+            print(f"错误: 请输入有效的日期格式 (YYYY-MM): {str(e)}")
+            return
 
-if __name__ == "__main__":
-    print("Testing schedule functionality...")
-    for _ in range(3):  # Run for 3 iterations to test schedule
-        schedule.run_pending()
-        time.sleep(1)
-    print("Schedule test completed")
+        if args.sweep:
+            ticker = args.ticker or app.config['tickers'][0]
+            app.run_parameter_sweep(ticker, start_date, end_date, samples=args.samples, max_workers=args.workers)
 
-    # 清除测试用的任务
-    schedule.clear()
+        if args.batch is not None:
+            tickers = args.batch or app.config['tickers']
+            app.run_batch_backtest(tickers, start_date, end_date, save_excel=args.excel, max_workers=args.workers)
 
-    # 继续正常的应用程序初始化
+    # 退出前尽量发送完发件箱中的消息，其余的下次启动时继续发送
+    if app.notification_queue is not None and not app.notification_queue.flush(app.config['reminder_timeout']):
+        print(f"还有 {app.notification_queue.pending()} 条消息未发送，将在下次启动时继续发送")
+        return EXIT_OUTBOX_PENDING
+    return 0
+
+
+def main():
+    # PyInstaller 打包后 --sweep 的工作进程会重新运行入口，必须先调用 freeze_support
+    multiprocessing.freeze_support()
     args = parse_arguments()
 
     if args.cli:
-        app = InvestmentApp(None)  # 初始化无 GUI 的 InvestmentApp
-        run_cli(app, args)
+        # 初始化无 GUI 的 InvestmentApp；定时任务使用保存的 token 时不发送登录测试消息
+        verify_login = not (args.send_reminder or args.flush_outbox)
+        app = InvestmentApp(None, token_file=args.token_file, verify_login=verify_login)
+        return run_cli(app, args)
     else:
+        load_gui_modules()
         root = tk.Tk()
         app = InvestmentApp(root)
         root.protocol("WM_DELETE_WINDOW", app.destroy)
         root.mainloop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
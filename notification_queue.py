@@ -0,0 +1,273 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from pushplus_sender import REJECTED, RETRY, SENT
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def file_lock(path):
+    """在 path 上加跨进程的排他锁，退出时释放；Linux/macOS 使用 fcntl，Windows 使用 msvcrt"""
+    with open(path, 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK 重试 10 秒后仍未获得锁，继续等待
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class NotificationQueue:
+    """
+    后台消息发送队列
+
+    enqueue 把消息追加到发件箱文件 outbox_file 后立即返回，由后台线程发送：
+    同时最多有 batch_size 条消息在发送，两批之间至少间隔 interval 秒。
+    暂时失败的消息留在发件箱中，每条消息按自己的失败次数指数退避重试，不影响其他消息；
+    被拒绝的消息（sender.deliver 返回 REJECTED）不再重试，转存到 dead_letter_file。
+
+    发件箱中每行是一条 JSON 记录：'add' 表示新消息，'claim' 表示某个队列在 expires 之前占用这条消息
+    （正在发送或等待重试），'done' 表示已送达或已转存。GUI 和 reminder_daemon.py 的子进程可能同时使用
+    同一个发件箱，所有读写都在 <outbox_file>.lock 的排他锁内进行：每次发送前重新读取发件箱，
+    只发送未完成且没有被占用的消息，并先写入 'claim'，因此同一条消息不会被两个进程同时发送；
+    压缩发件箱时也以文件的最新内容为准，不会丢失其他进程刚追加的消息。
+    进程退出或崩溃后，占用过期的消息会由其他进程或下次启动时继续发送。
+    """
+
+    def __init__(self, sender, outbox_file, batch_size=8, interval=1.0, timeout=15, retry_delay=30,
+                 max_retry_delay=600, poll_interval=5.0):
+        self.sender = sender
+        self.outbox_file = outbox_file
+        self.lock_file = outbox_file + '.lock'
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        # 没有可发送的消息时，每隔 poll_interval 秒重新读取发件箱，发现其他进程追加或放弃的消息
+        self.poll_interval = poll_interval
+        # 发送中的消息被占用的时长；超过这个时间仍未完成，视为发送它的进程已退出
+        self.lease = max(self.timeout * 4, 60)
+        self.dead_letter_file = os.path.splitext(outbox_file)[0] + '_rejected.jsonl'
+        self._pending = []
+        self._claims = {}
+        # 正在发送的消息 id；发送超时但仍在进行的消息不会被再次发送
+        self._in_flight = set()
+        # 消息 id -> 本队列发送失败的次数
+        self._retries = {}
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._load()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.batch_size)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """停止后台线程，未发送的消息保留在发件箱中"""
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def enqueue(self, title, content, template="html"):
+        message = {'op': 'add', 'id': uuid.uuid4().hex, 'title': title, 'content': content, 'template': template}
+        with self._condition:
+            with file_lock(self.lock_file):
+                self._append([message])
+            self._pending.append(message)
+            self._condition.notify_all()
+        return message['id']
+
+    def pending(self):
+        with self._condition:
+            return len(self._pending)
+
+    def flush(self, timeout=None):
+        """等待发件箱清空（包括其他进程正在发送的消息），超时返回 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._condition:
+                batch = self._claim_ready()
+                while not batch and not self._stop.is_set():
+                    self._condition.wait(self._next_wait())
+                    batch = self._claim_ready()
+                if self._stop.is_set():
+                    break
+
+            for message in batch:
+                try:
+                    future = self._executor.submit(self._deliver, message)
+                except RuntimeError:
+                    # stop() 已关闭线程池，释放占用，其他进程或下次启动时可以立即发送
+                    with self._condition:
+                        self._in_flight.discard(message['id'])
+                        with file_lock(self.lock_file):
+                            self._append([self._claim_record(message['id'], 0)])
+                    continue
+                future.add_done_callback(lambda f, m=message: self._finish(m, f.result()))
+            # 限制发送速率
+            self._stop.wait(self.interval)
+
+    def _claim_ready(self):
+        """
+        重新读取发件箱，占用可以发送的消息并返回
+
+        可以发送的消息：未完成、不在本队列的发送中、没有未过期的占用（包括本队列等待重试的占用），
+        并且不超过同时发送的上限
+        """
+        with file_lock(self.lock_file):
+            self._sync()
+            now = time.time()
+            slots = max(self.batch_size - len(self._in_flight), 0)
+            ready = [message for message in self._pending
+                     if message['id'] not in self._in_flight and self._claims.get(message['id'], 0) <= now][:slots]
+            if ready:
+                expires = now + self.lease
+                self._append([self._claim_record(message['id'], expires) for message in ready])
+                for message in ready:
+                    self._claims[message['id']] = expires
+        self._in_flight.update(message['id'] for message in ready)
+        if not self._pending:
+            # 其他进程已发送完所有消息，唤醒 flush
+            self._condition.notify_all()
+        return ready
+
+    def _next_wait(self):
+        """距离最早一条被占用的消息到期还有多久，最长 poll_interval；发送数已满时等待发送结果"""
+        if len(self._in_flight) >= self.batch_size:
+            return None
+        claimed = [self._claims[message['id']] for message in self._pending
+                   if message['id'] in self._claims and message['id'] not in self._in_flight]
+        if not claimed:
+            return self.poll_interval
+        return min(max(min(claimed) - time.time(), 0), self.poll_interval)
+
+    def _deliver(self, message):
+        try:
+            return self.sender.deliver(message['title'], message['content'], message['template'],
+                                       timeout=self.timeout)
+        except Exception as e:
+            print(f"发送 {message['title']} 时出错: {str(e)}")
+            return RETRY
+
+    def _finish(self, message, status):
+        with self._condition:
+            self._in_flight.discard(message['id'])
+            with file_lock(self.lock_file):
+                if status == SENT or status == REJECTED:
+                    if status == REJECTED:
+                        print(f"消息 {message['title']} 被拒绝，不再重试，已转存到 {self.dead_letter_file}")
+                        self._append([message], self.dead_letter_file)
+                    self._append([{'op': 'done', 'id': message['id']}])
+                    self._retries.pop(message['id'], None)
+                    self._sync()
+                    if not self._pending:
+                        # 发件箱已清空，压缩文件
+                        self._rewrite()
+                else:
+                    # 占用到重试时间，期间其他进程也不会发送这条消息
+                    attempts = self._retries.get(message['id'], 0) + 1
+                    delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+                    self._retries[message['id']] = attempts
+                    self._append([self._claim_record(message['id'], time.time() + delay)])
+                    self._sync()
+                    print(f"消息 {message['title']} 发送失败，{delay} 秒后重试")
+            self._condition.notify_all()
+
+    def _claim_record(self, message_id, expires):
+        return {'op': 'claim', 'id': message_id, 'expires': expires}
+
+    def _load(self):
+        with file_lock(self.lock_file):
+            self._sync()
+            if self._pending:
+                print(f"发件箱中有 {len(self._pending)} 条未发送的消息")
+            self._rewrite()
+
+    def _sync(self):
+        """按发件箱文件的最新内容更新未完成的消息和占用，调用时需持有文件锁"""
+        messages = {}
+        claims = {}
+        if os.path.exists(self.outbox_file):
+            with open(self.outbox_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 写入中断留下的半行
+                        continue
+                    if record['op'] == 'add':
+                        messages[record['id']] = record
+                    elif record['op'] == 'claim':
+                        claims[record['id']] = record['expires']
+                    else:
+                        messages.pop(record['id'], None)
+                        claims.pop(record['id'], None)
+        self._pending = list(messages.values())
+        self._claims = {message_id: expires for message_id, expires in claims.items() if message_id in messages}
+
+    def _append(self, records, path=None):
+        path = path or self.outbox_file
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def _rewrite(self):
+        """只保留未完成的消息和仍有效的占用，写入临时文件后替换发件箱；调用时需持有文件锁"""
+        now = time.time()
+        tmp_path = f'{self.outbox_file}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for message in self._pending:
+                f.write(json.dumps(message, ensure_ascii=False) + '\n')
+            for message_id, expires in self._claims.items():
+                if expires > now:
+                    f.write(json.dumps(self._claim_record(message_id, expires)) + '\n')
+        os.replace(tmp_path, self.outbox_file)
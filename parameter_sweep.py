@@ -0,0 +1,102 @@
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import BacktestEngine, summarize_backtest
+
+# 默认参数网格，只包含会影响回测结果的参数：
+# - MACD 窗口和 sma_window 不参与加权定投的权重计算（compute_weights 只使用波动率）
+# - 原始权重只有 0.5、1.0、1.5 三档，max_weight 不小于 1.5 时不起作用，因此只扫描 1.5 以内的上限
+DEFAULT_GRID = {
+    'std_window': [10, 20, 30, 60, 90],
+    'min_weight': [0.5, 0.6, 0.7, 0.8, 1.0],
+    'max_weight': [1.0, 1.25, 1.5],
+}
+
+# 每个任务处理的参数组合数，减少进程间通信次数
+CHUNK_SIZE = 64
+
+# 子进程中的只读价格数据
+_worker_state = {}
+
+
+def build_parameter_grid(grid=None):
+    """返回参数网格中所有组合的列表"""
+    grid = grid or DEFAULT_GRID
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def sample_parameters(grid=None, samples=100, seed=None):
+    """从参数网格中随机抽取 samples 个不重复的组合"""
+    combinations = build_parameter_grid(grid)
+    if samples >= len(combinations):
+        return combinations
+    return random.Random(seed).sample(combinations, samples)
+
+
+def _init_worker(shm_name, length, days, start_date, end_date, base_investment):
+    # 挂载父进程创建的共享内存，价格数组在所有子进程间共享且只读
+    shm = shared_memory.SharedMemory(name=shm_name)
+    values = np.ndarray((length,), dtype=np.float64, buffer=shm.buf)
+    values.flags.writeable = False
+    _worker_state.update({
+        'shm': shm,
+        'prices': pd.Series(values, index=pd.DatetimeIndex(days), copy=False),
+        'start_date': start_date,
+        'end_date': end_date,
+        'base_investment': base_investment,
+    })
+
+
+def _run_chunk(parameter_chunk):
+    state = _worker_state
+    results = []
+    for params in parameter_chunk:
+        # 上下限相同时权重恒定，结果与等额定投相同，与 std_window 无关
+        if params['min_weight'] >= params['max_weight']:
+            continue
+        engine = BacktestEngine(base_investment=state['base_investment'], **params)
+        daily_data = engine.run(state['prices'], state['start_date'], state['end_date'])
+        if daily_data is None:
+            continue
+        summary = summarize_backtest(daily_data, state['start_date'], state['end_date'])
+        results.append({**params, **summary})
+    return results
+
+
+def run_parameter_sweep(prices, start_date, end_date, base_investment, parameters, max_workers=None):
+    """
+    在进程池中对每组参数执行加权定投回测
+
+    prices 为复权收盘价序列，parameters 为参数字典列表（见 build_parameter_grid / sample_parameters）。
+    返回按加权年化回报率从高到低排序的结果表。
+    """
+    values = prices.to_numpy(dtype=np.float64)
+    days = pd.DatetimeIndex(prices.index).values
+    chunks = [parameters[i:i + CHUNK_SIZE] for i in range(0, len(parameters), CHUNK_SIZE)]
+
+    shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    try:
+        np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)[:] = values
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                 initializer=_init_worker,
+                                 initargs=(shm.name, len(values), days, start_date, end_date,
+                                           base_investment)) as executor:
+            results = [row for chunk_result in executor.map(_run_chunk, chunks) for row in chunk_result]
+    finally:
+        shm.close()
+        shm.unlink()
+
+    table = pd.DataFrame(results)
+    if table.empty:
+        return table
+    table = table.sort_values('weighted_annual_return', ascending=False).reset_index(drop=True)
+    table.index = table.index + 1
+    table.index.name = 'rank'
+    return table
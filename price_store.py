@@ -0,0 +1,323 @@
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytz
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+# npz 文件中的键名（避免列名中的空格）
+_COLUMN_KEYS = {
+    'Open': 'open',
+    'High': 'high',
+    'Low': 'low',
+    'Close': 'close',
+    'Adj Close': 'adj_close',
+    'Volume': 'volume',
+}
+
+# 行情所在交易所的时区，用于判断哪一天的K线尚未收盘
+EXCHANGE_TIMEZONE = 'America/New_York'
+
+# 增量下载时与已缓存区间重叠的天数，用于发现拆股或分红后重新复权的历史价格
+OVERLAP_DAYS = 10
+
+# 比较重叠部分的价格时使用的列（auto_adjust=False 时 Close 按拆股调整，Adj Close 还按分红调整）
+_ADJUSTED_COLUMNS = ['Close', 'Adj Close']
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return pd.Timestamp(value).date()
+
+
+def exchange_today():
+    """交易所所在时区的今天；北京时间晚上美股仍在交易时，本地日期已经是第二天"""
+    return datetime.now(pytz.timezone(EXCHANGE_TIMEZONE)).date()
+
+
+class PriceStore:
+    """
+    本地行情缓存
+
+    每个标的的日线数据以列式 NumPy 文件 (npz) 保存在 cache_dir 下，
+    同时记录已经覆盖的日期区间 [covered_start, covered_end)。
+    请求的区间若已被覆盖则直接从本地返回，否则只下载缺失的部分；
+    网络不可用时返回本地已有的数据。
+
+    下载缺失部分时会多取与已覆盖区间重叠的 OVERLAP_DAYS 天；拆股或分红后数据源会重新计算
+    全部历史的复权价格，重叠部分的价格与缓存不一致时丢弃该标的的缓存并重新下载完整区间。
+    """
+
+    def __init__(self, cache_dir=os.path.join('cache', 'prices'), refresh_interval=3600):
+        self.cache_dir = cache_dir
+        # 包含今天在内的区间，在 refresh_interval 秒内不重复下载
+        self.refresh_interval = refresh_interval
+        self._memory = {}
+        self._lock = threading.RLock()
+
+    def get_history(self, ticker, start, end):
+        """返回 ticker 在 [start, end) 内的日线数据，列为 PRICE_COLUMNS 中可用的部分"""
+        return self.get_histories([ticker], start, end)[ticker]
+
+    def get_histories(self, tickers, start, end):
+        """
+        批量返回多个标的在 [start, end) 内的日线数据
+
+        所有缺少数据的标的合并为一次 yf.download 请求，返回 {ticker: DataFrame}
+        """
+        start = _to_date(start)
+        end = _to_date(end)
+        tickers = list(dict.fromkeys(tickers))
+
+        with self._lock:
+            entries = {ticker: self._load(ticker) for ticker in tickers}
+            pending = {}
+            for ticker, entry in entries.items():
+                ranges = self._missing_ranges(entry, start, end)
+                if ranges:
+                    pending[ticker] = ranges
+
+            if pending:
+                # 所有缺失区间的并集，一次请求完成下载
+                fetch_start = min(r[0] for ranges in pending.values() for r in ranges)
+                fetch_end = max(r[1] for ranges in pending.values() for r in ranges)
+                raw = self._download(list(pending), fetch_start, fetch_end)
+                stale = []
+                for ticker in pending:
+                    fetched = None if raw is None else self._normalize(raw, ticker)
+                    if fetched is not None and self._is_stale(entries[ticker], fetched):
+                        stale.append(ticker)
+                        continue
+                    entries[ticker] = self._merge(ticker, entries[ticker], fetched, fetch_start, fetch_end)
+                if stale:
+                    self._refetch(stale, entries, fetch_start, fetch_end)
+
+        result = {}
+        for ticker, entry in entries.items():
+            if entry is None:
+                result[ticker] = pd.DataFrame(columns=PRICE_COLUMNS)
+            else:
+                result[ticker] = self._slice(entry['frame'], start, end)
+        return result
+
+    def is_cached(self, tickers, start, end):
+        """[start, end) 内的数据是否都可以直接从本地缓存返回，无需访问网络"""
+        start = _to_date(start)
+        end = _to_date(end)
+        with self._lock:
+            return not any(self._missing_ranges(self._load(ticker), start, end) for ticker in tickers)
+
+    def get_prices(self, tickers, start, end):
+        """
+        返回对齐后的宽表价格矩阵：行为交易日，列为标的（复权收盘价）
+
+        某个标的在某日没有数据时为 NaN
+        """
+        histories = self.get_histories(tickers, start, end)
+        columns = {ticker: self._price_column(frame) for ticker, frame in histories.items()}
+        prices = pd.DataFrame(columns)
+        return prices.reindex(columns=list(histories)).sort_index()
+
+    def get_latest_prices(self, tickers, timeout=10):
+        """一次请求获取多个标的最近的收盘价，返回 {ticker: price}，不写入缓存"""
+        import yfinance as yf
+
+        tickers = list(dict.fromkeys(tickers))
+        try:
+            raw = yf.download(tickers, period='5d', auto_adjust=False, progress=False, timeout=timeout)
+        except Exception as e:
+            print(f"批量获取最新价格时出错: {str(e)}")
+            return {}
+
+        latest = {}
+        for ticker in tickers:
+            frame = self._normalize(raw, ticker)
+            if 'Close' not in frame.columns:
+                continue
+            close = frame['Close'].dropna()
+            if not close.empty:
+                latest[ticker] = float(close.iloc[-1])
+        return latest
+
+    def get_adj_close(self, ticker, start, end):
+        """返回复权收盘价序列，缺少 'Adj Close' 时使用 'Close'"""
+        return self._price_column(self.get_history(ticker, start, end))
+
+    @staticmethod
+    def _price_column(data):
+        if 'Adj Close' in data.columns and data['Adj Close'].notna().any():
+            return data['Adj Close'].astype(float)
+        if 'Close' in data.columns:
+            return data['Close'].astype(float)
+        return pd.Series(dtype=float)
+
+    def _missing_ranges(self, entry, start, end):
+        if entry is None:
+            return [(start, end)]
+
+        # 缺失区间总是与已覆盖区间相邻，保证覆盖区间连续
+        # 每个缺失区间都向已覆盖区间内延伸 OVERLAP_DAYS 天，用于检查缓存是否需要重新复权
+        ranges = []
+        overlap = timedelta(days=OVERLAP_DAYS)
+        covered_start, covered_end = entry['covered_start'], entry['covered_end']
+        if start < covered_start:
+            ranges.append((start, min(covered_start + overlap, covered_end)))
+        if end > covered_end:
+            today = exchange_today()
+            recently_fetched = time.time() - entry['fetched_at'] < self.refresh_interval
+            # 今天的行情未收盘，只在缓存过期后重新获取
+            if not (covered_end >= today and recently_fetched):
+                ranges.append((max(covered_end - overlap, covered_start), end))
+        return ranges
+
+    @staticmethod
+    def _is_stale(entry, fetched):
+        """新下载的数据与缓存重叠的交易日上，复权价格是否不一致（期间发生过拆股或分红）"""
+        if entry is None or fetched.empty:
+            return False
+        cached = entry['frame']
+        in_covered = (fetched.index >= pd.Timestamp(entry['covered_start'])) & \
+                     (fetched.index < pd.Timestamp(entry['covered_end']))
+        common = fetched.index[in_covered].intersection(cached.index)
+        for column in _ADJUSTED_COLUMNS:
+            if common.empty or column not in fetched.columns or column not in cached.columns:
+                continue
+            old = cached.loc[common, column].to_numpy(dtype=float)
+            new = fetched.loc[common, column].to_numpy(dtype=float)
+            if not np.allclose(old, new, rtol=1e-6, atol=0, equal_nan=True):
+                return True
+        return False
+
+    def _refetch(self, tickers, entries, start, end):
+        """重新下载 tickers 的完整区间并替换缓存；下载失败时保留原来的缓存"""
+        refetch_start = min([start] + [entries[ticker]['covered_start'] for ticker in tickers])
+        refetch_end = max([end] + [entries[ticker]['covered_end'] for ticker in tickers])
+        print(f"{', '.join(tickers)} 的历史价格已重新复权（拆股或分红），重新下载完整区间")
+        raw = self._download(tickers, refetch_start, refetch_end)
+        for ticker in tickers:
+            fetched = None if raw is None else self._normalize(raw, ticker)
+            if fetched is None or fetched.empty:
+                print(f"重新下载 {ticker} 失败，暂时使用本地缓存")
+                continue
+            entries[ticker] = self._merge(ticker, None, fetched, refetch_start, refetch_end)
+
+    def _download(self, tickers, start, end):
+        # yfinance 导入较慢，只在需要下载时导入
+        import yfinance as yf
+
+        names = ', '.join(tickers)
+        try:
+            print(f"下载 {names} 的数据，从 {start} 到 {end}")
+            return yf.download(tickers, start=start, end=end, auto_adjust=False, progress=False)
+        except Exception as e:
+            print(f"下载 {names} 数据时出错: {str(e)}，使用本地缓存")
+            return None
+
+    @staticmethod
+    def _normalize(raw, ticker):
+        if raw is None or raw.empty:
+            return pd.DataFrame(columns=PRICE_COLUMNS)
+        frame = raw
+        if isinstance(frame.columns, pd.MultiIndex):
+            if ticker in frame.columns.get_level_values(-1):
+                frame = frame.xs(ticker, axis=1, level=-1)
+            elif frame.columns.get_level_values(-1).nunique() == 1:
+                frame = frame.droplevel(-1, axis=1)
+            else:
+                return pd.DataFrame(columns=PRICE_COLUMNS)
+        frame = frame[[col for col in PRICE_COLUMNS if col in frame.columns]].astype(float)
+        # 批量下载时其他标的的交易日会在此标的上产生空行
+        frame = frame.dropna(how='all')
+        index = pd.DatetimeIndex(frame.index)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        frame.index = index.normalize()
+        frame.columns.name = None
+        return frame
+
+    def _merge(self, ticker, entry, fetched, start, end):
+        if fetched is None:
+            return entry
+        # 空结果可能是节假日，也可能是数据源故障；只有短区间才视为已覆盖
+        if fetched.empty and (end - start).days > 7:
+            return entry
+
+        # 交易所今天的K线尚未收盘，不计入覆盖区间
+        fetched_end = min(end, exchange_today())
+
+        if entry is None:
+            frame = fetched
+            covered_start, covered_end = start, fetched_end
+        else:
+            frame = pd.concat([entry['frame'], fetched]) if not fetched.empty else entry['frame']
+            frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+            covered_start = min(entry['covered_start'], start)
+            covered_end = max(entry['covered_end'], fetched_end)
+
+        entry = {
+            'frame': frame,
+            'covered_start': covered_start,
+            'covered_end': covered_end,
+            'fetched_at': time.time(),
+        }
+        self._memory[ticker] = entry
+        self._save(ticker, entry)
+        return entry
+
+    @staticmethod
+    def _slice(frame, start, end):
+        index = frame.index
+        mask = (index >= pd.Timestamp(start)) & (index < pd.Timestamp(end))
+        return frame.loc[mask].copy()
+
+    def _cache_path(self, ticker):
+        return os.path.join(self.cache_dir, f'{ticker}.npz')
+
+    def _load(self, ticker):
+        if ticker in self._memory:
+            return self._memory[ticker]
+
+        path = self._cache_path(ticker)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path) as f:
+                index = pd.DatetimeIndex(f['dates'].astype('datetime64[ns]'))
+                columns = {col: f[key] for col, key in _COLUMN_KEYS.items() if key in f.files}
+                covered = f['covered'].astype(object)
+                fetched_at = float(f['fetched_at'])
+        except Exception as e:
+            print(f"读取 {ticker} 的本地缓存失败: {str(e)}")
+            return None
+
+        entry = {
+            'frame': pd.DataFrame(columns, index=index),
+            'covered_start': covered[0],
+            'covered_end': covered[1],
+            'fetched_at': fetched_at,
+        }
+        self._memory[ticker] = entry
+        return entry
+
+    def _save(self, ticker, entry):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        frame = entry['frame']
+        arrays = {_COLUMN_KEYS[col]: frame[col].to_numpy(dtype=float) for col in frame.columns}
+        arrays['dates'] = frame.index.values.astype('datetime64[D]')
+        arrays['covered'] = np.array([entry['covered_start'], entry['covered_end']], dtype='datetime64[D]')
+        arrays['fetched_at'] = np.array(entry['fetched_at'])
+
+        # 先写临时文件再替换，避免写入中断导致缓存损坏
+        path = self._cache_path(ticker)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
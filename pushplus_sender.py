@@ -1,12 +1,58 @@
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_BASE_URL = "http://www.pushplus.plus/send"
+
+# deliver 的返回值：已送达 / 暂时失败，可以重试 / 被拒绝，重试也不会成功
+SENT = 'sent'
+RETRY = 'retry'
+REJECTED = 'rejected'
+
+# PushPlus 返回的业务码中可以稍后重试的部分（900: 调用频率受限，999: 服务端异常）
+RETRYABLE_CODES = (900, 999)
 
 
 class PushPlusSender:
-    def __init__(self, token):
+    """
+    PushPlus 消息发送
+
+    所有请求复用同一个保持连接的 requests.Session；连接失败或遇到 429 和 5xx 时按指数退避重试
+    （优先使用服务器返回的 Retry-After）。base_url 可替换为本地测试服务器的地址。
+    """
+
+    def __init__(self, token, base_url=DEFAULT_BASE_URL, timeout=(3.05, 10), retries=3, backoff_factor=0.5,
+                 pool_size=10):
         self.token = token
-        self.base_url = "http://www.pushplus.plus/send"
+        self.base_url = base_url
+        # (连接超时, 读取超时)，单位为秒
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            # 读取超时时消息可能已送达，不重试以免重复推送
+            read=0,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['POST']),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
-    def send_message(self, title, content, template="html"):
+        self._lock = threading.Lock()
+        self.metrics = {'sent': 0, 'failed': 0, 'total_latency': 0.0, 'max_latency': 0.0}
+
+    def send_message(self, title, content, template="html", timeout=None):
+        return self.deliver(title, content, template, timeout) == SENT
+
+    def deliver(self, title, content, template="html", timeout=None):
+        """发送消息并返回 SENT、RETRY 或 REJECTED，供需要区分失败原因的调用方（如发送队列）使用"""
         data = {
             "token": self.token,
             "title": title,
@@ -14,23 +60,48 @@ class PushPlusSender:
             "template": template
         }
 
-        response = requests.post(self.base_url, json=data)
-
-        if response.status_code == 200:
-            result = response.json()
-            if result["code"] == 200:
-                print("消息发送成功")
-                return True
+        started = time.perf_counter()
+        try:
+            response = self.session.post(self.base_url, json=data, timeout=timeout or self.timeout)
+            if response.status_code == 200:
+                result = response.json()
+                if result["code"] == 200:
+                    print("消息发送成功")
+                    return self._record(started, SENT)
+                else:
+                    print(f"消息发送失败: {result['msg']}")
+                    return self._record(started, RETRY if result["code"] in RETRYABLE_CODES else REJECTED)
             else:
-                print(f"消息发送失败: {result['msg']}")
-                return False
-        else:
-            print(f"请求失败: {response.status_code}")
-            return False
+                print(f"请求失败: {response.status_code}")
+                # 429 和 5xx 已由 Retry 重试过，仍失败时稍后再试；其他 4xx 是请求本身的问题
+                retryable = response.status_code == 429 or response.status_code >= 500
+                return self._record(started, RETRY if retryable else REJECTED)
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f"请求失败: {str(e)}")
+            return self._record(started, RETRY)
+
+    def get_metrics(self):
+        """返回发送统计：成功/失败次数、平均和最大耗时（秒）"""
+        with self._lock:
+            metrics = dict(self.metrics)
+        count = metrics['sent'] + metrics['failed']
+        metrics['average_latency'] = metrics['total_latency'] / count if count else 0.0
+        return metrics
+
+    def close(self):
+        self.session.close()
+
+    def _record(self, started, status):
+        latency = time.perf_counter() - started
+        with self._lock:
+            self.metrics['sent' if status == SENT else 'failed'] += 1
+            self.metrics['total_latency'] += latency
+            self.metrics['max_latency'] = max(self.metrics['max_latency'], latency)
+        return status
 
 
 # 使用示例
 if __name__ == "__main__":
     token = ""
     sender = PushPlusSender(token)
-    sender.send_message("测试标题", "这是一条测试消息")
\ No newline at end of file
+    sender.send_message("测试标题", "这是一条测试消息")
@@ -0,0 +1,163 @@
+"""
+无界面的定投提醒守护进程
+
+    python reminder_daemon.py [--settings reminder_daemon.json]
+
+守护进程本身只导入调度所需的模块，空闲时占用的内存很少；到达提醒时间后，
+在子进程中运行 `main.py --cli --send-reminder` 加载分析相关的模块并发送提醒，
+子进程退出后内存随之释放。PushPlus 暂时不可用、消息留在发件箱中时，
+每隔 retry_interval 秒运行 `main.py --cli --flush-outbox` 重新发送，最多 retry_attempts 次。
+
+SIGTERM / SIGINT 停止守护进程，SIGHUP 重新读取设置文件并重新计算下一次提醒时间。
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+from datetime import time as datetime_time
+
+from reminder_scheduler import ReminderScheduler
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+# 与 main.EXIT_OUTBOX_PENDING 一致；不导入 main，避免守护进程加载分析模块
+EXIT_OUTBOX_PENDING = 3
+
+DEFAULT_SETTINGS = {
+    'at': '08:00',
+    'timezone': 'Asia/Shanghai',
+    'token_file': 'pushplus_token.json',
+    # 单次提醒任务的超时时间（秒）
+    'job_timeout': 600,
+    # 发件箱中还有未发送的消息时，重新发送的间隔（秒）和最多次数
+    'retry_interval': 300,
+    'retry_attempts': 12,
+}
+
+
+def get_resident_memory():
+    """返回当前进程的常驻内存（MB），无法获取时返回 None"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节（峰值）
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class ReminderDaemon:
+    def __init__(self, settings_file='reminder_daemon.json'):
+        self.settings_file = settings_file
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.stopping = False
+        self.reload_requested = False
+        self._scheduler_stop = None
+        self._thread = None
+
+    def load_settings(self):
+        settings = dict(DEFAULT_SETTINGS)
+        if os.path.exists(self.settings_file):
+            try:
+                with open(self.settings_file, 'r') as f:
+                    settings.update(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"读取设置文件 {self.settings_file} 失败: {str(e)}，使用默认设置")
+        self.settings = settings
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self._handle_reload)
+
+        while not self.stopping:
+            self.reload_requested = False
+            self.load_settings()
+            if not os.path.exists(self.settings['token_file']):
+                print(f"错误: 未找到 {self.settings['token_file']}，"
+                      f"请先使用 main.py --cli --token-file {self.settings['token_file']} --login TOKEN 登录PushPlus")
+                return 1
+            self._start_scheduler()
+            self.report_memory()
+
+            # 调度在后台线程中进行，信号处理函数设置 _scheduler_stop 后线程退出
+            self._thread.join()
+            if self.reload_requested and not self.stopping:
+                print("重新加载设置")
+
+        print("定投提醒守护进程已停止")
+        return 0
+
+    def send_reminder(self):
+        # 在子进程中加载分析模块，避免守护进程常驻这些内存
+        returncode = self._run_child('--send-reminder')
+        attempts = 0
+        while returncode == EXIT_OUTBOX_PENDING and attempts < self.settings['retry_attempts']:
+            # 等待期间收到 SIGTERM / SIGHUP 时立即返回，未发送的消息仍保存在发件箱中
+            if self._scheduler_stop.wait(self.settings['retry_interval']):
+                break
+            attempts += 1
+            print(f"重新发送发件箱中的消息（第 {attempts} 次）")
+            returncode = self._run_child('--flush-outbox')
+        if returncode == EXIT_OUTBOX_PENDING:
+            print("发件箱中仍有未发送的消息，将在下一次提醒时继续发送")
+        self.report_memory()
+
+    def _run_child(self, action):
+        command = [sys.executable, MAIN_SCRIPT, '--cli', action, '--token-file', self.settings['token_file'],
+                   '--timezone', self.settings['timezone']]
+        try:
+            result = subprocess.run(command, timeout=self.settings['job_timeout'])
+        except subprocess.TimeoutExpired:
+            print(f"提醒任务超过 {self.settings['job_timeout']} 秒未完成，已终止")
+            return None
+        if result.returncode not in (0, EXIT_OUTBOX_PENDING):
+            print(f"提醒任务退出码: {result.returncode}")
+        return result.returncode
+
+    def report_memory(self):
+        rss = get_resident_memory()
+        if rss is not None:
+            print(f"守护进程常驻内存: {rss:.1f} MB")
+
+    def _start_scheduler(self):
+        hour, minute = (int(part) for part in self.settings['at'].split(':'))
+        self._scheduler_stop = threading.Event()
+        scheduler = ReminderScheduler(self.send_reminder, self._scheduler_stop, at=datetime_time(hour, minute),
+                                      timezone=self.settings['timezone'])
+        self._thread = threading.Thread(target=scheduler.run, daemon=True)
+        self._thread.start()
+
+    def _handle_stop(self, signum, frame):
+        self.stopping = True
+        if self._scheduler_stop is not None:
+            self._scheduler_stop.set()
+
+    def _handle_reload(self, signum, frame):
+        self.reload_requested = True
+        if self._scheduler_stop is not None:
+            self._scheduler_stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless investment reminder daemon")
+    parser.add_argument("--settings", default="reminder_daemon.json",
+                        help="JSON settings file (at, timezone, token_file, job_timeout, retry_interval, "
+                             "retry_attempts)")
+    args = parser.parse_args()
+    return ReminderDaemon(args.settings).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import threading
+from datetime import datetime, timedelta, time as datetime_time
+
+import pytz
+
+from investment_calendar import get_second_wednesday
+
+# 单次等待的上限（秒）。系统休眠或调整时钟后，最迟在这个时间内重新计算触发时间
+MAX_WAIT = 3600
+
+
+def next_reminder_time(now, timezone, at=datetime_time(8, 0)):
+    """返回晚于 now 的下一次提醒时间：每月第二个周三的 at 时刻（timezone 时区）"""
+    month_start = now.astimezone(timezone).date().replace(day=1)
+    fire_time = timezone.localize(datetime.combine(get_second_wednesday(month_start), at))
+    if fire_time > now:
+        return fire_time
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
+    return timezone.localize(datetime.combine(get_second_wednesday(next_month), at))
+
+
+class ReminderScheduler:
+    """
+    定投提醒调度
+
+    根据每月第二个周三的规则计算下一次触发时间，在 stop_event 上等待到该时间再执行 job；
+    等待期间不轮询，stop_event 被设置后立即返回。
+    """
+
+    def __init__(self, job, stop_event=None, at=datetime_time(8, 0), timezone='Asia/Shanghai'):
+        self.job = job
+        self.stop_event = stop_event or threading.Event()
+        self.at = at
+        self.timezone = pytz.timezone(timezone)
+        self.next_fire_time = None
+
+    def run(self):
+        """在当前线程中运行，直到 stop_event 被设置"""
+        self.next_fire_time = next_reminder_time(self._now(), self.timezone, self.at)
+        print(f"下一次定投提醒时间: {self.next_fire_time.strftime('%Y-%m-%d %H:%M')} ({self.timezone.zone})")
+        while not self.stop_event.is_set():
+            remaining = (self.next_fire_time - self._now()).total_seconds()
+            if remaining > 0:
+                self.stop_event.wait(min(remaining, MAX_WAIT))
+                continue
+
+            try:
+                self.job()
+            except Exception as e:
+                print(f"执行定投提醒时出错: {str(e)}")
+            self.next_fire_time = next_reminder_time(max(self._now(), self.next_fire_time), self.timezone, self.at)
+            print(f"下一次定投提醒时间: {self.next_fire_time.strftime('%Y-%m-%d %H:%M')} ({self.timezone.zone})")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _now(self):
+        return datetime.now(self.timezone)
@@ -9,7 +9,6 @@ setup(
         "numpy",
         "matplotlib",
         "pandas",
-        "schedule",
         "Pillow",
         "qrcode",
         "requests",